@@ -1,62 +1,43 @@
+import sys
+
+# Headless batch mode is dispatched before tkinter, NumPy or any other GUI-only module is imported
+if __name__ == "__main__" and "--batch" in sys.argv[1:]:
+    from aiprompt_core.batch import batch_main
+    sys.exit(batch_main(sys.argv[1:]))
+
 import platform
-import requests
-import subprocess
+import asyncio
+import atexit
 import threading
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, ttk
-import json
 import os
 import time
-import glob
-import sys
 import traceback
 import logging
-import signal
-import psutil
-import openai
-
-# Set up logging and chat directories based on platform
-def setup_app_directories():
-    if platform.system().lower().startswith('win'):
-        # Use AppData for Windows
-        base_dir = os.path.join(os.environ.get('APPDATA', ''), 'AIPrompt')
-    else:
-        # Use Application Support for macOS (more standard than Library)
-        base_dir = os.path.expanduser("~/Library/Application Support/AIPrompt")
-    
-    # Create standard subdirectories
-    log_dir = os.path.join(base_dir, 'Logs')
-    chat_dir = os.path.join(base_dir, 'Chats')
-    
-    # Create directories
-    for directory in [log_dir, chat_dir]:
-        try:
-            os.makedirs(directory, exist_ok=True)
-        except Exception as e:
-            print(f"Error creating directory {directory}: {e}")
-            logging.error(f"Error creating directory {directory}: {e}")
-    
-    return log_dir, chat_dir
-
-# Set up logging
-def setup_logging(log_dir):
-    log_file = os.path.join(log_dir, "aiprompt.log")
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
-    logging.info("Starting AIPrompt application")
-
-# Initialize directories
-LOG_DIR, CHAT_DIR = setup_app_directories()
-
-# Redirect stdout/stderr to a file to catch crashes in --windowed mode
-try:
-    sys.stdout = open(os.path.join(LOG_DIR, "aiprompt_stdout.log"), "w")
-    sys.stderr = open(os.path.join(LOG_DIR, "aiprompt_stderr.log"), "w")
-except Exception as e:
-    print(f"Failed to redirect stdout/stderr: {e}")
+
+from aiprompt_core.caches import ModelListCache, ResponseCache
+from aiprompt_core.commands import CommandRunner
+from aiprompt_core.config import (
+    OPENAI_BASE_URL, MODEL_KEEP_ALIVE_INTERVAL, app_directories, ensure_app_directories, setup_logging
+)
+from aiprompt_core.metrics import RequestMetrics
+from aiprompt_core.parsing import ShellResponseStreamParser
+from aiprompt_core.persistence import ChatSaver
+from aiprompt_core.providers import ProviderEngine
+from aiprompt_core.session import ChatSession
+from aiprompt_core.store import open_chat_store
+
+# Application directories (created at startup, not on import)
+LOG_DIR, CHAT_DIR, CACHE_DIR = app_directories()
+
+def redirect_output(log_dir):
+    """Redirect stdout/stderr to files to catch crashes in --windowed mode"""
+    try:
+        sys.stdout = open(os.path.join(log_dir, "aiprompt_stdout.log"), "w")
+        sys.stderr = open(os.path.join(log_dir, "aiprompt_stderr.log"), "w")
+    except Exception as e:
+        print(f"Failed to redirect stdout/stderr: {e}")
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -113,47 +94,97 @@ class LMStudioApp:
         logging.info(f"Starting AIPrompt application on {platform.system()}")
 
         # Redirect stdout/stderr
-        try:
-            sys.stdout = open(os.path.join(self.log_dir, "aiprompt_stdout.log"), "w")
-            sys.stderr = open(os.path.join(self.log_dir, "aiprompt_stderr.log"), "w")
-        except Exception as e:
-            print(f"Failed to redirect stdout/stderr: {e}")
+        redirect_output(self.log_dir)
 
-        # Initialize conversation history
-        self.conversation_history = []
-        self.current_chat_id = self.generate_chat_id()
-        self.current_chat_title = "New Chat"
+        # Terminal output of the current chat (the conversation itself lives in self.session)
         self.terminal_output = []
 
-        # Create chats directory if it doesn't exist
-        os.makedirs(CHAT_DIR, exist_ok=True)
+        # Create the chat and cache directories if they don't exist
+        ensure_app_directories()
+        # JSON chat files by default, SQLite with AIPROMPT_STORE=sqlite
+        self.chat_store = open_chat_store(CHAT_DIR)
+        # Chats are saved on a background thread; pending saves are flushed when the window closes
+        self.chat_saver = ChatSaver(self.chat_store)
+        atexit.register(self.chat_saver.close, 10)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Default LM Studio info
         self.lmstudio_url_default = "http://localhost:1234"  # Changed to localhost
         self.server_url = tk.StringVar(master=self.root, value=self.lmstudio_url_default)
+        # All provider I/O runs on one background event loop
+        self.engine = ProviderEngine(latency_path=os.path.join(CACHE_DIR, "latency.json"))
+        # Learned deadlines are written at most every LatencyPolicy.SAVE_INTERVAL seconds; keep the rest on exit
+        atexit.register(self.engine.latency_policy.flush)
+        self.pending_request = None
+        self.pending_fan_out = None
+        self.engine.on_retry = self.on_provider_retry
+        # Learned deadline of the current request, shown beside the Send button
+        self.deadline_text = tk.StringVar(master=self.root, value="")
+        # Timings of the last provider call for the status bar; every call is also logged to metrics.jsonl
+        self.metrics_text = tk.StringVar(master=self.root, value="")
+        self.request_metrics = RequestMetrics(os.path.join(LOG_DIR, "metrics.jsonl"))
+        atexit.register(self.request_metrics.close)
         self.openai_api_key = tk.StringVar(master=self.root, value="")
+        # OpenAI clients are reused across prompts until the API key changes
+        self.openai_api_key.trace_add("write", self.on_api_key_change)
 
         # Track which provider is selected
         self.ai_provider = tk.StringVar(master=self.root, value="LM Studio")
         self.selected_model = tk.StringVar(master=self.root, value="")
+        # Stream completions token by token into the Instructions and Commands boxes
+        self.stream_responses = tk.BooleanVar(master=self.root, value=True)
+        # Answer repeated prompts from the on-disk response cache (opt-in)
+        self.cache_responses = tk.BooleanVar(master=self.root, value=False)
+        self.response_cache = ResponseCache(os.path.join(CACHE_DIR, "Responses"))
+        # Cache hits reorder its LRU index in memory only
+        atexit.register(self.response_cache.flush)
+        # Conversation state and request building, shared with the headless batch mode
+        self.session = ChatSession(
+            self.engine,
+            is_windows=self.is_windows,
+            response_cache=self.response_cache,
+            on_commit=self.on_exchange_committed,
+            on_notice=lambda message: self.root.after(0, self.log_output, message)
+        )
+        # Similarity index over past exchanges; prompts scoring above the threshold can skip the model
+        self.exchange_index = self.create_exchange_index()
+        self.reuse_threshold = tk.DoubleVar(master=self.root, value=0.85)
+        self.suggestion = None
+        self.suggestion_job = None
+        # Warm-up state of the selected LM Studio model, shown next to the model dropdown
+        self.warm_state = tk.StringVar(master=self.root, value="")
+        self.keep_model_warm = tk.BooleanVar(master=self.root, value=False)
+        self.warm_key = None
+        self.warm_future = None
+        self.last_model_activity = time.time()
 
         # Model list for either LM Studio or OpenAI
         self.models_list = []
+        # Last-known model lists, persisted across launches
+        self.model_cache = ModelListCache(os.path.join(CACHE_DIR, "models.json"))
 
-        # Process tracking
-        self.current_process = None
-        self.output_running = False
+        # Runs the recommended commands and tracks the running process
+        self.command_runner = CommandRunner(is_windows=self.is_windows)
         self.current_shell_command = ""
 
         # Create the UI
         self.create_widgets()
 
-        # By default, use LM Studio as our client
-        self.refresh_models()
+        # By default, use LM Studio as our client. Show the cached model list right away
+        # and only go to the network if it is missing or older than the TTL.
+        self.load_cached_models()
+        self.selected_model.trace_add("write", self.on_model_selected)
+        # Load the restored model now so the first prompt doesn't wait for it
+        self.warm_up_model()
+        self.root.after(MODEL_KEEP_ALIVE_INTERVAL * 1000, self.keep_alive_tick)
         
         # Load existing chats on startup
         self.update_chat_list()
 
+        # Index past exchanges in the background for similar-command suggestions
+        if self.exchange_index is not None:
+            threading.Thread(target=self.build_exchange_index, daemon=True).start()
+
     def create_widgets(self):
         """
         Builds the entire Tkinter UI:
@@ -226,7 +257,7 @@ class LMStudioApp:
         config_frame = tk.Frame(main_frame)
         config_frame.pack(fill=tk.X, padx=5, pady=5)
 
-        self.server_label = tk.Label(config_frame, text="LM Studio Server URL:")
+        self.server_label = tk.Label(config_frame, text="LM Studio Server URL(s):")
         self.server_label.pack(side=tk.LEFT)
         self.server_entry = tk.Entry(config_frame, textvariable=self.server_url, width=40)
         self.server_entry.pack(side=tk.LEFT, padx=5)
@@ -250,6 +281,8 @@ class LMStudioApp:
             width=40
         )
         self.model_dropdown.pack(side=tk.LEFT, padx=5)
+        tk.Label(model_frame, textvariable=self.warm_state, fg="gray").pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(model_frame, text="Keep Model Warm", variable=self.keep_model_warm).pack(side=tk.RIGHT)
 
         # --- PanedWindow for Instructions, Prompt, Commands, and Output ---
         self.main_paned = tk.PanedWindow(main_frame, orient=tk.VERTICAL)
@@ -261,14 +294,36 @@ class LMStudioApp:
         tk.Label(instructions_frame, text=f"Instructions from {self.shell_label} Assistant:").pack(anchor="w")
         self.instructions_text = scrolledtext.ScrolledText(instructions_frame, wrap="word", height=6)
         self.instructions_text.pack(fill=tk.BOTH, expand=True)
+        self.instructions_text.tag_configure("marker", foreground="gray")
         self.instructions_text.config(state=tk.DISABLED)
 
         # 2) Prompt Input Frame
         prompt_frame = tk.Frame(self.main_paned)
         self.main_paned.add(prompt_frame, minsize=80)
         tk.Label(prompt_frame, text="Enter your prompt:").pack(anchor="w")
+
+        # Closest command from past chats, updated while typing
+        suggestion_frame = tk.Frame(prompt_frame)
+        suggestion_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.suggestion_label = tk.Label(suggestion_frame, text="", anchor="w", fg="gray")
+        self.suggestion_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Spinbox(
+            suggestion_frame,
+            from_=0.5,
+            to=1.0,
+            increment=0.05,
+            width=5,
+            textvariable=self.reuse_threshold
+        ).pack(side=tk.RIGHT)
+        tk.Label(suggestion_frame, text="Reuse above:").pack(side=tk.RIGHT)
+        self.use_suggestion_button = tk.Button(suggestion_frame, text="Use Suggestion", command=self.use_suggestion, state=tk.DISABLED)
+        self.use_suggestion_button.pack(side=tk.RIGHT, padx=5)
+        if self.exchange_index is None:
+            suggestion_frame.pack_forget()
+
         self.prompt_text = scrolledtext.ScrolledText(prompt_frame, wrap="word", height=6)
         self.prompt_text.pack(fill=tk.BOTH, expand=True)
+        self.prompt_text.bind('<KeyRelease>', self.on_prompt_key)
 
         # 3) Recommended Commands Frame (editable)
         commands_frame = tk.Frame(self.main_paned)
@@ -312,6 +367,14 @@ class LMStudioApp:
         self.send_prompt_button = tk.Button(button_frame, text="Send Prompt", command=self.on_send_prompt)
         self.send_prompt_button.pack(side=tk.LEFT, padx=(0, 5))
 
+        # Cancel aborts the in-flight provider request (initially disabled)
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_pending_request, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 5))
+
+        # Sends the same prompt to several models at once
+        self.fan_out_button = tk.Button(button_frame, text="Send to Models...", command=self.open_fan_out_dialog)
+        self.fan_out_button.pack(side=tk.LEFT, padx=(0, 5))
+
         self.copy_output_button = tk.Button(button_frame, text="Copy Output to Prompt", command=self.copy_output_to_prompt)
         self.copy_output_button.pack(side=tk.LEFT, padx=(0, 5))
 
@@ -323,6 +386,14 @@ class LMStudioApp:
         self.clear_output_button = tk.Button(button_frame, text="Clear Output", command=self.clear_output)
         self.clear_output_button.pack(side=tk.LEFT, padx=(0, 5))
 
+        tk.Label(button_frame, textvariable=self.deadline_text, fg="gray").pack(side=tk.LEFT, padx=(0, 5))
+
+        tk.Checkbutton(button_frame, text="Stream Response", variable=self.stream_responses).pack(side=tk.RIGHT)
+        tk.Checkbutton(button_frame, text="Cache Responses", variable=self.cache_responses).pack(side=tk.RIGHT)
+
+        # --- Status Bar: timings of the last provider request ---
+        tk.Label(main_frame, textvariable=self.metrics_text, anchor="w", fg="gray", relief=tk.SUNKEN, bd=1).pack(fill=tk.X, padx=5, pady=(0, 5))
+
     # ---------------------- Provider Handling ----------------------
     def on_provider_change(self, event):
         """
@@ -331,7 +402,7 @@ class LMStudioApp:
         """
         provider = self.ai_provider.get()
         if provider == "LM Studio":
-            self.server_label.config(text="LM Studio Server URL:")
+            self.server_label.config(text="LM Studio Server URL(s):")
             self.server_label.pack(side=tk.LEFT)
             self.server_entry.pack(side=tk.LEFT, padx=5)
             # Hide OpenAI fields
@@ -347,76 +418,155 @@ class LMStudioApp:
             # Show OpenAI fields
             self.api_key_label.pack(side=tk.LEFT)
             self.api_key_entry.pack(side=tk.LEFT, padx=5)
-        # Clear model list and dropdown
-        self.models_list.clear()
+        # Clear model list and dropdown, then show whatever is cached for the new provider
+        self.models_list = []
         self.model_dropdown['values'] = []
         self.selected_model.set("")
+        self.load_cached_models()
+
+    def model_source(self, provider=None):
+        """
+        Identifies where a provider's models come from (the server URL for LM Studio).
+        """
+        provider = provider or self.ai_provider.get()
+        return self.server_url.get() if provider == "LM Studio" else OPENAI_BASE_URL
+
+    def load_cached_models(self):
+        """
+        Fills the model dropdown from the persistent cache and revalidates
+        in the background when the cached list is missing or stale.
+        """
+        provider = self.ai_provider.get()
+        entry = self.model_cache.get(provider, self.model_source(provider))
+        if entry and entry.get("models"):
+            self.update_model_dropdown(entry["models"], entry.get("selected"))
+        if not self.model_cache.is_fresh(entry):
+            self.refresh_models()
+
+    def on_model_selected(self, *args):
+        """
+        Remember the selected model so it is restored at next launch.
+        """
+        model = self.selected_model.get()
+        if model and model in self.models_list:
+            provider = self.ai_provider.get()
+            self.model_cache.store_selection(provider, self.model_source(provider), model)
+            self.warm_up_model()
+        else:
+            self.warm_state.set("")
+
+    def on_api_key_change(self, *args):
+        """
+        Drop cached OpenAI clients whenever the API key field is edited.
+        """
+        self.engine.openai_clients.invalidate()
 
     def refresh_models(self):
         """
         Fetches the list of models depending on the selected AI provider.
         """
         provider = self.ai_provider.get()
+        source = self.model_source(provider)
+        api_key = self.openai_api_key.get()
         self.log_output(f"Refreshing models from {provider}...")
 
-        def do_refresh():
-            if provider == "LM Studio":
-                models = self.get_lm_studio_models()
-            else:
-                models = self.get_openai_models(self.openai_api_key.get())
+        async def do_refresh():
+            try:
+                models = await self.engine.list_models(provider, server_url=source, api_key=api_key)
+            except Exception as e:
+                print(f"Error fetching {provider} models:", e)
+                models = []
 
             if models:
-                self.models_list = models
-                self.root.after(0, self.update_model_dropdown)
+                self.model_cache.store_models(provider, source, models)
+                self.root.after(0, self.apply_refreshed_models, provider, source, models)
                 self.log_output("Models refreshed: " + ", ".join(models))
             else:
                 self.log_output("Failed to refresh models.")
 
-        threading.Thread(target=do_refresh, daemon=True).start()
+        self.engine.submit(do_refresh())
 
-    def get_lm_studio_models(self):
+    def apply_refreshed_models(self, provider, source, models):
         """
-        Retrieves model IDs from LM Studio's /v1/models endpoint.
+        Applies a background refresh, unless the provider or server changed meanwhile.
         """
-        url = self.server_url.get().rstrip('/') + "/v1/models"
-        try:
-            resp = requests.get(url, timeout=5)
-            resp.raise_for_status()
-            data = resp.json()
-            if isinstance(data, dict) and "data" in data:
-                return [m["id"] for m in data["data"]]
-            return []
-        except Exception as e:
-            print("Error fetching LM Studio models:", e)
-            return []
+        if provider != self.ai_provider.get() or source != self.model_source(provider):
+            return
+        entry = self.model_cache.get(provider, source)
+        self.update_model_dropdown(models, entry.get("selected") if entry else None)
 
-    def get_openai_models(self, api_key):
+    def update_model_dropdown(self, models, preferred=None):
         """
-        Retrieves model IDs from OpenAI's /v1/models endpoint.
+        Updates the model dropdown with the retrieved models.
+        Only touches the widget when the list actually changed, and keeps the
+        current selection if the model is still available.
         """
-        url = "https://api.openai.com/v1/models"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        try:
-            resp = requests.get(url, headers=headers, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            if isinstance(data, dict) and "data" in data:
-                return [m["id"] for m in data["data"]]
-            return []
-        except Exception as e:
-            print("Error fetching OpenAI models:", e)
-            return []
+        models = list(models)
+        if models != self.models_list:
+            added = [m for m in models if m not in self.models_list]
+            removed = [m for m in self.models_list if m not in models]
+            if added or removed:
+                logging.info(f"Model list changed: +{added} -{removed}")
+            self.models_list = models
+            self.model_dropdown['values'] = models
+
+        current = self.selected_model.get()
+        if current in models:
+            return
+        if preferred in models:
+            self.selected_model.set(preferred)
+        elif models:
+            self.selected_model.set(models[0])
 
-    def update_model_dropdown(self):
+    # ---------------------- Model Warm-up ----------------------
+    def warm_up_model(self, keep_alive=False):
         """
-        Updates the model dropdown with the retrieved models.
+        Sends a one-token request for the selected LM Studio model so it is loaded
+        (and the system prompt prefilled) before the first real prompt.
+        OpenAI models need no warm-up.
+        """
+        provider = self.ai_provider.get()
+        model = self.selected_model.get()
+        if provider != "LM Studio" or not model:
+            self.warm_state.set("")
+            return
+        source = self.server_url.get()
+        key = (source, model)
+        if key == self.warm_key and self.warm_future is not None and not self.warm_future.done():
+            return
+        self.warm_key = key
+        if not keep_alive:
+            self.warm_state.set("Loading model...")
+        system_prompt = self.session.system_prompts["LM Studio"]
+
+        async def do_warm_up():
+            try:
+                timings = await self.engine.warm_up_lm_studio(source, model, system_prompt)
+            except Exception as e:
+                logging.warning(f"Warm-up of {model} failed: {e}")
+                self.root.after(0, self.set_warm_state, key, "Model not loaded (warm-up failed)")
+                return
+            self.last_model_activity = time.time()
+            logging.info(f"Warm-up of {model}: " + ", ".join(f"{url} {t:.2f}s" for url, t in timings.items()))
+            state = "Model ready (kept warm)" if keep_alive else f"Model ready ({max(timings.values()):.1f}s)"
+            self.root.after(0, self.set_warm_state, key, state)
+
+        self.warm_future = self.engine.submit(do_warm_up())
+
+    def set_warm_state(self, key, text):
+        # Results for a model that is no longer selected are ignored
+        if key == (self.server_url.get(), self.selected_model.get()):
+            self.warm_state.set(text)
+
+    def keep_alive_tick(self):
+        """
+        Periodically pings the selected model while the app is idle so LM Studio
+        doesn't unload it, when "Keep Model Warm" is checked.
         """
-        self.model_dropdown['values'] = self.models_list
-        if self.models_list and not self.selected_model.get():
-            self.selected_model.set(self.models_list[0])
+        idle = time.time() - self.last_model_activity >= MODEL_KEEP_ALIVE_INTERVAL
+        if self.keep_model_warm.get() and idle and self.pending_request is None:
+            self.warm_up_model(keep_alive=True)
+        self.root.after(MODEL_KEEP_ALIVE_INTERVAL * 1000, self.keep_alive_tick)
 
     # ---------------------- Prompt Handling ----------------------
     def on_send_prompt(self):
@@ -435,294 +585,424 @@ class LMStudioApp:
             messagebox.showwarning("Warning", "Please select a model.")
             return
 
-        self.log_output(f"Sending prompt to {provider} using model: {model}")
+        # A near-identical past prompt can be answered without calling the model
+        match = self.find_reusable_exchange(prompt)
+        if match:
+            score, (_, _, previous) = match
+            command = previous.get(self.shell_key, "").strip()
+            if messagebox.askyesno(
+                "Reuse Previous Answer",
+                f"A previous prompt matches this one (similarity {score:.2f}):\n\n{command}\n\n"
+                "Use that answer instead of calling the model?"
+            ):
+                self.reuse_exchange(prompt, previous, score)
+                return
 
-        def do_send():
+        self.log_output(f"Sending prompt to {provider} using model: {model}")
+        self.show_deadline(provider, model)
+
+        stream = self.stream_responses.get()
+        if stream:
+            self.set_instructions("")
+        parser = ShellResponseStreamParser()
+
+        def on_token(token):
+            # Surface the shell command as soon as its string closes, while instructions keep streaming
+            for kind, field, value in parser.feed(token):
+                if kind == "delta" and field == "instructions":
+                    self.root.after(0, self.append_instructions, value)
+                elif kind == "field" and field == self.shell_key:
+                    self.root.after(0, self.show_shell_command, value.strip())
+
+        server_url = self.server_url.get()
+        api_key = self.openai_api_key.get()
+        use_cache = self.cache_responses.get()
+
+        async def do_send():
+            metrics = {}
             if provider == "LM Studio":
-                response = self.send_lm_studio_prompt(model, prompt)
+                response = await self.session.send_lm_studio_prompt(model, prompt, server_url, on_token=on_token if stream else None, use_cache=use_cache, metrics=metrics)
             else:
-                response = self.send_openai_prompt(model, prompt, self.openai_api_key.get())
-
-            if response:
-                # Pick the shell command based on OS
-                shell_cmd = response.get("powershell" if self.is_windows else "zsh", "").strip()
-                instructions = response.get("instructions", "").strip()
-
-                # Update instructions box (read-only)
-                self.instructions_text.config(state=tk.NORMAL)
-                self.instructions_text.delete("1.0", tk.END)
-                self.instructions_text.insert(tk.END, instructions)
-                self.instructions_text.config(state=tk.DISABLED)
-
-                # Update recommended commands box (editable)
-                self.commands_text.config(state=tk.NORMAL)
-                self.commands_text.delete("1.0", tk.END)
-                self.commands_text.insert(tk.END, shell_cmd)
-
-                self.current_shell_command = shell_cmd
-                if shell_cmd:
-                    self.run_command_button.config(state=tk.NORMAL)
-                else:
-                    self.run_command_button.config(state=tk.DISABLED)
+                response = await self.session.send_openai_prompt(model, prompt, api_key, on_token=on_token if stream else None, use_cache=use_cache, metrics=metrics)
+            self.record_request_metrics(provider, model, metrics)
+            return response
+
+        self.pending_request = self.engine.submit(do_send())
+        self.send_prompt_button.config(state=tk.DISABLED)
+        self.fan_out_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.root.after(100, self.poll_pending_request)
+
+    def poll_pending_request(self):
+        """
+        Polls the in-flight prompt future from the Tk main loop and shows the result when done.
+        """
+        future = self.pending_request
+        if future is None:
+            return
+        if not future.done():
+            self.root.after(100, self.poll_pending_request)
+            return
+
+        self.pending_request = None
+        self.last_model_activity = time.time()
+        fan_out, self.pending_fan_out = self.pending_fan_out, None
+        self.send_prompt_button.config(state=tk.NORMAL)
+        self.fan_out_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        if future.cancelled():
+            self.log_output("Request cancelled.")
+            return
+
+        try:
+            response = future.result()
+        except Exception as e:
+            logging.error(f"Prompt request failed: {e}")
+            response = None
+
+        if fan_out:
+            self.finish_fan_out(*fan_out, response or [])
+            return
+        self.show_response(response)
+
+    def show_response(self, response):
+        """
+        Shows a structured response in the instructions and recommended command boxes.
+        """
+        if response:
+            # Pick the shell command based on OS
+            shell_cmd = response.get("powershell" if self.is_windows else "zsh", "").strip()
+            instructions = response.get("instructions", "").strip()
+
+            # Update instructions box (read-only), replacing any streamed preview
+            self.set_instructions(instructions, marker="(cached response)" if response.get("cached") else None)
+
+            # Update recommended commands box (editable)
+            self.show_shell_command(shell_cmd)
+        else:
+            self.log_output("Error: No response or invalid response from AI.")
+
+    def show_deadline(self, provider, model):
+        """
+        Shows the timeout the engine will apply to this model's next request.
+        """
+        deadline, samples = self.engine.latency_policy.deadline(provider, model, 1000 if provider == "LM Studio" else None)
+        basis = f"learned from {samples} replies" if samples >= self.engine.latency_policy.MIN_SAMPLES else "default"
+        self.deadline_text.set(f"Timeout {deadline:.0f}s ({basis})")
+
+    def on_provider_retry(self, provider, model, attempt, delay, error):
+        """
+        Called on the engine loop before a transient failure is retried.
+        """
+        self.root.after(0, self.log_output,
+            f"{provider} {model}: {type(error).__name__}, retrying in {delay:.1f}s "
+            f"(attempt {attempt + 1} of {self.engine.latency_policy.MAX_RETRIES + 1})")
+
+    def record_request_metrics(self, provider, model, metrics):
+        """
+        Writes the metrics of a finished provider call to the metrics file and shows
+        them in the status bar. Cached answers make no provider call and are skipped.
+        """
+        if metrics.get("total_s") is None:
+            return
+        row = self.request_metrics.record(provider, model, metrics)
+        self.root.after(0, self.metrics_text.set, RequestMetrics.summary(row))
+
+    def on_exchange_committed(self):
+        """
+        Saves the chat after the session recorded an exchange.
+        """
+        # Update chat list on the Tk thread once the chat is on disk
+        self.save_current_chat(on_saved=lambda: self.root.after(0, self.update_chat_list))
+
+    def cancel_pending_request(self):
+        """
+        Aborts the in-flight prompt request, closing its connection so the server stops generating.
+        """
+        if self.pending_request is not None and not self.pending_request.done():
+            self.log_output("Cancelling request...")
+            self.pending_request.cancel()
+
+    # ---------------------- Multi-model Fan-out ----------------------
+    def fan_out_targets(self):
+        """
+        (provider, model) pairs available for fan-out, taken from the known model lists
+        of both providers. OpenAI models are only offered when an API key is set.
+        """
+        targets = []
+        for provider in ("LM Studio", "OpenAI"):
+            if provider == "OpenAI" and not self.openai_api_key.get():
+                continue
+            models = list(self.models_list) if provider == self.ai_provider.get() else []
+            entry = self.model_cache.get(provider, self.model_source(provider))
+            models += (entry or {}).get("models", [])
+            for model in models:
+                if (provider, model) not in targets:
+                    targets.append((provider, model))
+        return targets
+
+    def open_fan_out_dialog(self):
+        """
+        Lets the user pick several models and a policy, then sends the prompt to all of them.
+        """
+        prompt = self.prompt_text.get("1.0", tk.END).strip()
+        if not prompt:
+            messagebox.showwarning("Warning", "Please enter a prompt.")
+            return
+        targets = self.fan_out_targets()
+        if len(targets) < 2:
+            messagebox.showwarning("Warning", "At least two models are needed. Refresh the model list of each provider first.")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Send to Multiple Models")
+        dialog.transient(self.root)
+
+        tk.Label(dialog, text="Models (select two or more):").pack(anchor="w", padx=5, pady=(5, 0))
+        listbox = tk.Listbox(dialog, selectmode=tk.MULTIPLE, height=min(len(targets), 12), width=60, exportselection=False)
+        for provider, model in targets:
+            listbox.insert(tk.END, f"{provider}: {model}")
+        current = (self.ai_provider.get(), self.selected_model.get())
+        if current in targets:
+            listbox.selection_set(targets.index(current))
+        listbox.pack(fill=tk.BOTH, expand=True, padx=5)
+
+        policy = tk.StringVar(master=self.root, value="race")
+        tk.Radiobutton(dialog, text="Race: use the first valid answer and cancel the rest", variable=policy, value="race").pack(anchor="w", padx=5)
+        tk.Radiobutton(dialog, text="Compare: show every answer side by side", variable=policy, value="compare").pack(anchor="w", padx=5)
+
+        def start():
+            chosen = [targets[i] for i in listbox.curselection()]
+            if len(chosen) < 2:
+                messagebox.showwarning("Warning", "Please select at least two models.", parent=dialog)
+                return
+            dialog.destroy()
+            self.send_fan_out(prompt, chosen, policy.get())
+
+        button_row = tk.Frame(dialog)
+        button_row.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(button_row, text="Send", command=start).pack(side=tk.LEFT)
+        tk.Button(button_row, text="Close", command=dialog.destroy).pack(side=tk.RIGHT)
+
+    def send_fan_out(self, prompt, targets, policy):
+        """
+        Sends one prompt concurrently to every (provider, model) in targets.
+        With the "race" policy the first valid structured response wins and the other
+        requests are cancelled; with "compare" all responses are collected.
+        Nothing is added to the conversation until an answer is chosen.
+        """
+        self.log_output(f"Sending prompt to {len(targets)} models ({policy}): " + ", ".join(f"{p}: {m}" for p, m in targets))
+        server_url = self.server_url.get()
+        api_key = self.openai_api_key.get()
+        use_cache = self.cache_responses.get()
+
+        async def send_one(provider, model):
+            usage = {}
+            metrics = {}
+            start = time.perf_counter()
+            if provider == "LM Studio":
+                response = await self.session.send_lm_studio_prompt(model, prompt, server_url, use_cache=use_cache, usage=usage, commit=False, metrics=metrics)
             else:
-                self.log_output("Error: No response or invalid response from AI.")
-
-        threading.Thread(target=do_send, daemon=True).start()
-
-    def send_lm_studio_prompt(self, model, user_prompt):
-        """
-        Sends a chat-style request to LM Studio's /v1/chat/completions.
-        Includes structured output format and OS-specific system prompts.
-        """
-        # Define the JSON schema for structured output
-        json_schema = {
-            "name": "shell_response",
-            "strict": "true",
-            "schema": {
-                "type": "object",
-                "properties": {
-                    "powershell": {
-                        "type": "string",
-                        "description": "ONLY the exact PowerShell commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
-                    },
-                    "zsh": {
-                        "type": "string",
-                        "description": "ONLY the exact ZSH commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
-                    },
-                    "instructions": {
-                        "type": "string",
-                        "description": "All explanations, context, examples, and command descriptions go here. Use Markdown formatting."
-                    },
-                    "title": {
-                        "type": "string",
-                        "description": "A short, descriptive title for this chat exchange (max 50 characters)"
-                    }
-                },
-                "required": ["powershell", "zsh", "instructions", "title"]
-            }
-        }
-
-        # Include conversation history in the messages
-        messages = []
-        for exchange in self.conversation_history:
-            messages.append({"role": "user", "content": exchange["prompt"]})
-            if "response" in exchange:
-                messages.append({"role": "assistant", "content": json.dumps(exchange["response"])})
+                response = await self.session.send_openai_prompt(model, prompt, api_key, use_cache=use_cache, usage=usage, commit=False, metrics=metrics)
+            self.record_request_metrics(provider, model, metrics)
+            return {"provider": provider, "model": model, "response": response, "latency": time.perf_counter() - start, "usage": usage}
 
-        if self.is_windows:
-            system_prompt = (
-                "You are a highly skilled Windows PowerShell expert specializing in system administration, "
-                "automation, and development tasks. Your responses should be tailored for Windows environments "
-                "and utilize PowerShell's advanced features effectively.\n\n"
-                "For every response, output a JSON object with these keys:\n\n"
-                "• \"powershell\": ONLY include the exact PowerShell commands to execute. No comments, no explanations, "
-                "no backticks, no markdown formatting. Multiple commands should be separated by semicolons or newlines. "
-                "If no command is needed, output an empty string (\"\").\n\n"
-                "• \"zsh\": Always output an empty string (\"\") since we're on Windows.\n\n"
-                "• \"instructions\": All other information goes here, including:\n"
-                "  - Command explanations and descriptions\n"
-                "  - Prerequisites or dependencies\n"
-                "  - Expected output or behavior\n"
-                "  - Error handling and troubleshooting\n"
-                "  - Alternative approaches\n"
-                "  - Code examples and documentation\n"
-                "You may use Markdown formatting in this field only.\n\n"
-                "• \"title\": A concise, descriptive title for this chat exchange (max 50 characters).\n\n"
-                "Ensure all PowerShell commands follow security best practices and are safe to execute.\n\n"
-                "IMPORTANT: Never include command explanations or markdown formatting in the powershell field - "
-                "all explanatory text must go in the instructions field."
-            )
+        async def do_fan_out():
+            tasks = [asyncio.ensure_future(send_one(provider, model)) for provider, model in targets]
+            results = []
+            try:
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        results.append(task.result())
+                        if policy == "race" and self.is_valid_response(results[-1]["response"]):
+                            return [results[-1]]
+                return results
+            finally:
+                # Losing requests are aborted, closing their connections
+                for task in tasks:
+                    task.cancel()
+
+        self.pending_request = self.engine.submit(do_fan_out())
+        self.pending_fan_out = (prompt, policy)
+        self.send_prompt_button.config(state=tk.DISABLED)
+        self.fan_out_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.root.after(100, self.poll_pending_request)
+
+    @staticmethod
+    def is_valid_response(response):
+        return bool(response) and not response.get("error") and "instructions" in response
+
+    def finish_fan_out(self, prompt, policy, results):
+        """
+        Handles finished fan-out results on the Tk thread.
+        """
+        valid = [r for r in results if self.is_valid_response(r["response"])]
+        if not valid:
+            self.log_output("Error: No model returned a valid response.")
+            return
+        if policy == "race":
+            winner = valid[0]
+            self.log_output(f"{winner['provider']}: {winner['model']} answered first in {winner['latency']:.2f}s; other requests cancelled.")
+            self.choose_fan_out_result(prompt, winner)
         else:
-            system_prompt = (
-                "You are a highly skilled Unix/macOS shell expert specializing in ZSH, system administration, "
-                "and development tasks. Your responses should be tailored for Unix/macOS environments "
-                "and leverage ZSH's advanced features effectively.\n\n"
-                "For every response, output a JSON object with these keys:\n\n"
-                "• \"zsh\": ONLY include the exact ZSH commands to execute. No comments, no explanations, "
-                "no backticks, no markdown formatting. Multiple commands should be separated by semicolons or newlines. "
-                "If no command is needed, output an empty string (\"\").\n\n"
-                "• \"powershell\": Always output an empty string (\"\") since we're on Unix/macOS.\n\n"
-                "• \"instructions\": All other information goes here, including:\n"
-                "  - Command explanations and descriptions\n"
-                "  - Prerequisites or dependencies\n"
-                "  - Expected output or behavior\n"
-                "  - Error handling and troubleshooting\n"
-                "  - Alternative approaches\n"
-                "  - Code examples and documentation\n"
-                "You may use Markdown formatting in this field only.\n\n"
-                "• \"title\": A concise, descriptive title for this chat exchange (max 50 characters).\n\n"
-                "Ensure all commands follow security best practices and are safe to execute.\n\n"
-                "IMPORTANT: Never include command explanations or markdown formatting in the zsh field - "
-                "all explanatory text must go in the instructions field."
-            )
-
-        # Add system prompt and current user prompt
-        messages = [{"role": "system", "content": system_prompt}] + messages
-        messages.append({"role": "user", "content": user_prompt})
-
-        # Base payload that works for all models
-        payload = {
-            "model": model,
-            "messages": messages,
-            "response_format": {
-                "type": "json_schema",
-                "json_schema": json_schema
-            },
-            "max_tokens": 1000
-        }
-
-        url = self.server_url.get().rstrip('/') + "/v1/chat/completions"
-        try:
-            resp = requests.post(url, json=payload, timeout=15)
-            resp.raise_for_status()
-            data = resp.json()
-            if "choices" not in data or len(data["choices"]) == 0:
-                return None
-            assistant_message = data["choices"][0]["message"]["content"]
-            # Strip markdown code block markers if present
-            if assistant_message.startswith("```json"):
-                assistant_message = assistant_message.replace("```json", "").rstrip("```").strip()
+            self.show_fan_out_comparison(prompt, results)
+
+    def choose_fan_out_result(self, prompt, result):
+        """
+        Adds the chosen fan-out answer to the conversation and shows it.
+        """
+        response = {k: v for k, v in result["response"].items() if k != "cached"}
+        self.session.commit_exchange(prompt, response)
+        self.show_response(result["response"])
+
+    def show_fan_out_comparison(self, prompt, results):
+        """
+        Shows each model's command, latency and token counts side by side; the
+        selected row's instructions are previewed below and "Use Selected" keeps it.
+        """
+        window = tk.Toplevel(self.root)
+        window.title("Compare Model Responses")
+        window.transient(self.root)
+
+        columns = ("model", "command", "latency", "tokens")
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=min(len(results), 10), selectmode="browse")
+        for column, heading, width in (
+            ("model", "Model", 220), ("command", "Command", 360), ("latency", "Latency", 80), ("tokens", "Tokens (in/out)", 110)
+        ):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, anchor="w")
+        for i, result in enumerate(results):
+            response = result["response"] or {}
+            if self.is_valid_response(response):
+                command = " ; ".join(response.get(self.shell_key, "").strip().splitlines()) or "(no command)"
+            else:
+                command = "(no valid response)"
+            usage = result["usage"]
+            if response.get("cached"):
+                tokens = "cached"
+            elif usage:
+                tokens = f"{usage.get('prompt_tokens', '?')} / {usage.get('completion_tokens', '?')}"
+            else:
+                tokens = "n/a"
+            tree.insert("", tk.END, iid=str(i), values=(
+                f"{result['provider']}: {result['model']}", command, f"{result['latency']:.2f}s", tokens
+            ))
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        preview = scrolledtext.ScrolledText(window, wrap="word", height=10, state=tk.DISABLED)
+        preview.pack(fill=tk.BOTH, expand=True, padx=5)
+
+        def on_select(event=None):
+            selection = tree.selection()
+            response = (results[int(selection[0])]["response"] or {}) if selection else {}
+            preview.config(state=tk.NORMAL)
+            preview.delete("1.0", tk.END)
+            preview.insert(tk.END, response.get("instructions", ""))
+            preview.config(state=tk.DISABLED)
+
+        def use_selected(event=None):
+            selection = tree.selection()
+            if not selection:
+                return
+            result = results[int(selection[0])]
+            if not self.is_valid_response(result["response"]):
+                messagebox.showwarning("Warning", "That model did not return a valid response.", parent=window)
+                return
+            window.destroy()
+            self.log_output(f"Using the answer from {result['provider']}: {result['model']}")
+            self.choose_fan_out_result(prompt, result)
+
+        tree.bind("<<TreeviewSelect>>", on_select)
+        tree.bind("<Double-1>", use_selected)
+        button_row = tk.Frame(window)
+        button_row.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(button_row, text="Use Selected", command=use_selected).pack(side=tk.LEFT)
+        tk.Button(button_row, text="Discard All", command=window.destroy).pack(side=tk.RIGHT)
+
+    # ---------------------- Similar Exchanges ----------------------
+    def create_exchange_index(self):
+        """
+        Returns the similarity index, or None when NumPy isn't installed (imported here so only the GUI loads NumPy).
+        """
+        from aiprompt_core.similarity import ExchangeIndex, np
+        return ExchangeIndex(self.shell_key) if np is not None else None
+
+    def build_exchange_index(self):
+        """
+        Indexes every saved chat's exchanges (runs on a background thread at startup).
+        """
+        for chat_data in self.chat_store.iter_chats():
             try:
-                parsed = json.loads(assistant_message)
-                # Update chat title if this is the first message
-                if not self.conversation_history:
-                    self.current_chat_title = parsed.get('title', 'New Chat')
-                # Add to conversation history
-                self.conversation_history.append({
-                    "prompt": user_prompt,
-                    "response": parsed
-                })
-                # Save chat
-                self.save_current_chat()
-                # Update chat list
-                self.update_chat_list()
-                return parsed
-            except json.JSONDecodeError:
-                return { self.shell_key: "", "instructions": assistant_message }
-        except Exception as e:
-            print("Error sending LM Studio prompt:", e)
-            return None
+                self.exchange_index.update_chat(chat_data['id'], chat_data.get('history', []))
+            except Exception as e:
+                logging.error(f"Failed to index chat {chat_data.get('id')}: {str(e)}")
+
+    def on_prompt_key(self, event=None):
+        """
+        Debounces suggestion lookups while the user types.
+        """
+        if self.exchange_index is None:
+            return
+        if self.suggestion_job is not None:
+            self.root.after_cancel(self.suggestion_job)
+        self.suggestion_job = self.root.after(150, self.update_suggestion)
+
+    def update_suggestion(self):
+        """
+        Shows the closest prior command for the current prompt with its similarity score.
+        """
+        self.suggestion_job = None
+        prompt = self.prompt_text.get("1.0", tk.END).strip()
+        matches = self.exchange_index.search(prompt, limit=1) if prompt else []
+        if not matches:
+            self.suggestion = None
+            self.suggestion_label.config(text="")
+            self.use_suggestion_button.config(state=tk.DISABLED)
+            return
+        self.suggestion = matches[0]
+        score, (_, _, response) = self.suggestion
+        command = " ".join(response.get(self.shell_key, "").split())
+        if len(command) > 80:
+            command = command[:77] + "..."
+        self.suggestion_label.config(text=f"Similar ({score:.2f}): {command}")
+        self.use_suggestion_button.config(state=tk.NORMAL)
+
+    def use_suggestion(self):
+        """
+        Answers the current prompt with the suggested previous exchange.
+        """
+        prompt = self.prompt_text.get("1.0", tk.END).strip()
+        if self.suggestion and prompt:
+            score, (_, _, response) = self.suggestion
+            self.reuse_exchange(prompt, response, score)
 
-    def send_openai_prompt(self, model, user_prompt, api_key):
+    def find_reusable_exchange(self, prompt):
         """
-        Send a chat-style request to OpenAI's /v1/chat/completions endpoint.
-        Uses OpenAI's structured output format for GPT-4 and newer models.
+        Returns the best (score, entry) match at or above the reuse threshold, or None.
         """
+        if self.exchange_index is None:
+            return None
         try:
-            # Create OpenAI client
-            client = openai.OpenAI(api_key=api_key)
-            
-            # Define the JSON schema for structured output
-            json_schema = {
-                "type": "object",
-                "properties": {
-                    "powershell": {
-                        "type": "string",
-                        "description": "ONLY the exact PowerShell commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
-                    },
-                    "zsh": {
-                        "type": "string",
-                        "description": "ONLY the exact ZSH commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
-                    },
-                    "instructions": {
-                        "type": "string",
-                        "description": "All explanations, context, examples, and command descriptions go here. Use Markdown formatting."
-                    },
-                    "title": {
-                        "type": "string",
-                        "description": "A short, descriptive title for this chat exchange (max 50 characters)"
-                    }
-                },
-                "required": ["powershell", "zsh", "instructions", "title"]
-            }
-            
-            # System prompt based on OS
-            if platform.system() == "Windows":
-                system_prompt = """You are a Windows PowerShell automation expert. Follow these rules:
-1. Provide PowerShell commands that are safe and effective
-2. Include detailed explanations of what each command does
-3. Format response as a JSON object with these fields:
-   - powershell: ONLY the exact PowerShell commands (no backticks/comments)
-   - zsh: Empty string for Windows
-   - instructions: Markdown-formatted explanations
-   - title: Short descriptive title (max 50 chars)
-4. Ensure all commands are properly escaped and quoted
-5. Use absolute paths when necessary"""
-            else:
-                system_prompt = """You are a Unix/macOS shell automation expert. Follow these rules:
-1. Provide ZSH commands that are safe and effective
-2. Include detailed explanations of what each command does
-3. Format response as a JSON object with these fields:
-   - powershell: Empty string for Unix/macOS
-   - zsh: ONLY the exact ZSH commands (no backticks/comments)
-   - instructions: Markdown-formatted explanations
-   - title: Short descriptive title (max 50 chars)
-4. Ensure all commands are properly escaped and quoted
-5. Use absolute paths when necessary"""
-
-            # Include conversation history in the messages
-            messages = []
-            for exchange in self.conversation_history:
-                messages.append({"role": "user", "content": exchange["prompt"]})
-                if "response" in exchange:
-                    messages.append({"role": "assistant", "content": json.dumps(exchange["response"])})
-
-            # Add system prompt and current user prompt
-            messages = [{"role": "system", "content": system_prompt}] + messages
-            messages.append({"role": "user", "content": user_prompt})
-
-            # Create chat completion with function calling
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                response_format={"type": "json_object", "schema": json_schema}
-            )
-            
-            # Extract and validate the response
-            response_text = response.choices[0].message.content
-            response_data = json.loads(response_text)
-            
-            # Validate required fields
-            required_fields = ["powershell", "zsh", "instructions", "title"]
-            for field in required_fields:
-                if field not in response_data:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Update chat title if this is the first message
-            if not self.conversation_history:
-                self.current_chat_title = response_data.get('title', 'New Chat')
-            
-            # Add to conversation history
-            self.conversation_history.append({
-                "prompt": user_prompt,
-                "response": response_data
-            })
-            
-            # Save chat
-            self.save_current_chat()
-            
-            # Update chat list
-            self.update_chat_list()
-            
-            return response_data
-            
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse OpenAI response: {e}")
-            return {
-                "powershell": "",
-                "zsh": "",
-                "instructions": "Error: Invalid response format from OpenAI",
-                "title": "Error Processing Response"
-            }
-        except Exception as e:
-            logging.error(f"OpenAI API error: {e}")
-            return {
-                "powershell": "",
-                "zsh": "",
-                "instructions": f"Error: {str(e)}",
-                "title": "API Error"
-            }
+            threshold = float(self.reuse_threshold.get())
+        except (tk.TclError, ValueError):
+            return None
+        matches = self.exchange_index.search(prompt, limit=1)
+        if matches and matches[0][0] >= threshold:
+            return matches[0]
+        return None
+
+    def reuse_exchange(self, prompt, response, score):
+        """
+        Records a previous answer as the response to this prompt, skipping the model call.
+        """
+        response = dict(response)
+        self.log_output(f"Reusing previous answer (similarity {score:.2f})")
+        self.session.commit_exchange(prompt, response)
+        self.set_instructions(response.get("instructions", "").strip(), marker=f"(reused from a previous chat, similarity {score:.2f})")
+        self.show_shell_command(response.get(self.shell_key, "").strip())
 
     # ---------------------- Command Execution ----------------------
     def on_run_command(self):
@@ -745,105 +1025,33 @@ class LMStudioApp:
         
         # Enable kill button
         self.kill_button.config(state=tk.NORMAL)
-        self.output_running = True
 
-        def run_command():
-            try:
-                if self.is_windows:
-                    # For Windows, use hidden PowerShell window
-                    startupinfo = subprocess.STARTUPINFO()
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                    startupinfo.wShowWindow = subprocess.SW_HIDE
-                    
-                    process = subprocess.Popen(
-                        ["powershell", "-NoProfile", "-WindowStyle", "Hidden", "-Command", command],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
-                        startupinfo=startupinfo
-                    )
-                else:
-                    # For Unix/Mac, use process group
-                    process = subprocess.Popen(
-                        command,
-                        shell=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        preexec_fn=os.setsid
-                    )
-                
-                self.current_process = process
-                
-                # Set up a buffer for output
-                output_buffer = []
-                max_buffer_size = 1000  # Maximum lines to keep in history
-                
-                while self.output_running:
-                    line = process.stdout.readline()
-                    if not line and process.poll() is not None:
-                        break
-                    if line:
-                        # Add to buffer if not too large
-                        if len(output_buffer) < max_buffer_size:
-                            output_buffer.append(line.rstrip())
-                        self.root.after(0, self.log_output, line.rstrip())
-                
-                # If process is still running when loop exits, terminate it
-                if process.poll() is None:
-                    self.kill_current_process()
-                
-                # Save reasonable amount of output to chat history
-                self.terminal_output = output_buffer
-                
-                self.log_output("Command execution completed.")
-                
-            except Exception as e:
-                self.log_output(f"Error executing command: {str(e)}")
-            finally:
-                self.current_process = None
-                self.output_running = False
-                self.root.after(0, lambda: self.kill_button.config(state=tk.DISABLED))
+        def on_exit(output, error):
+            self.root.after(0, self.finish_shell_command, output, error)
 
-        threading.Thread(target=run_command, daemon=True).start()
+        self.command_runner.start(command, lambda line: self.root.after(0, self.log_output, line), on_exit)
+
+    def finish_shell_command(self, output, error):
+        """
+        Called on the Tk thread once the command has exited.
+        """
+        if error:
+            self.log_output(f"Error executing command: {error}")
+        else:
+            # Save reasonable amount of output to chat history
+            self.terminal_output = output
+            self.log_output("Command execution completed.")
+        self.kill_button.config(state=tk.DISABLED)
 
     def kill_current_process(self):
         """Kill the currently running command process and all its children"""
-        if self.current_process:
+        if self.command_runner.process:
             try:
-                self.output_running = False
-                
-                if self.is_windows:
-                    try:
-                        # On Windows, first try to gracefully terminate PowerShell
-                        subprocess.run(
-                            ["powershell", "-Command", "Get-Process -Id " + str(self.current_process.pid) + " | Stop-Process -Force"],
-                            timeout=2
-                        )
-                    except:
-                        # If that fails, use psutil as backup
-                        try:
-                            parent = psutil.Process(self.current_process.pid)
-                            for child in parent.children(recursive=True):
-                                try:
-                                    child.terminate()
-                                except:
-                                    child.kill()
-                            parent.terminate()
-                        except:
-                            # Last resort: force kill
-                            self.current_process.kill()
-                else:
-                    # On Unix, kill the process group
-                    os.killpg(os.getpgid(self.current_process.pid), signal.SIGTERM)
-                    
+                self.command_runner.kill()
                 self.log_output("\nCommand terminated by user.")
-                
             except Exception as e:
                 self.log_output(f"\nError killing process: {str(e)}")
             finally:
-                self.current_process = None
                 self.kill_button.config(state=tk.DISABLED)
 
     # ---------------------- Utility Functions ----------------------
@@ -855,6 +1063,41 @@ class LMStudioApp:
         self.output_text.see(tk.END)
         self.terminal_output.append(message)  # Save to history
 
+    def set_instructions(self, text, marker=None):
+        """
+        Replace the contents of the read-only Instructions box.
+        An optional marker line (e.g. for cached responses) is shown above the text.
+        """
+        self.instructions_text.config(state=tk.NORMAL)
+        self.instructions_text.delete("1.0", tk.END)
+        if marker:
+            self.instructions_text.insert(tk.END, marker + "\n\n", "marker")
+        self.instructions_text.insert(tk.END, text)
+        self.instructions_text.config(state=tk.DISABLED)
+
+    def show_shell_command(self, shell_cmd):
+        """
+        Put a shell command in the Recommended Commands box and enable Run when non-empty.
+        """
+        self.commands_text.config(state=tk.NORMAL)
+        self.commands_text.delete("1.0", tk.END)
+        self.commands_text.insert(tk.END, shell_cmd)
+
+        self.current_shell_command = shell_cmd
+        if shell_cmd:
+            self.run_command_button.config(state=tk.NORMAL)
+        else:
+            self.run_command_button.config(state=tk.DISABLED)
+
+    def append_instructions(self, text):
+        """
+        Append streamed text to the read-only Instructions box.
+        """
+        self.instructions_text.config(state=tk.NORMAL)
+        self.instructions_text.insert(tk.END, text)
+        self.instructions_text.see(tk.END)
+        self.instructions_text.config(state=tk.DISABLED)
+
     def copy_output_to_prompt(self):
         """
         Copies the Terminal Output text into the Prompt box.
@@ -880,11 +1123,11 @@ class LMStudioApp:
     def start_new_chat(self, force_new=False):
         """Start a new chat session"""
         # Kill any running process before starting new chat
-        if self.current_process:
+        if self.command_runner.process:
             self.kill_current_process()
         
         # Save current chat if exists and we're not forcing a new one
-        if not force_new and hasattr(self, 'current_chat_id') and self.current_chat_id:
+        if not force_new and self.session.chat_id:
             self.save_current_chat()
         
         self.initialize_new_chat()
@@ -900,10 +1143,8 @@ class LMStudioApp:
         self.output_text.delete("1.0", tk.END)
         
         # Reset conversation history and terminal output
-        self.current_chat_id = self.generate_chat_id()
-        self.conversation_history = []
+        self.session.reset()
         self.terminal_output = []
-        self.current_chat_title = "New Chat"
         
         # Clear any existing selection
         self.history_list.selection_clear(0, tk.END)
@@ -914,46 +1155,30 @@ class LMStudioApp:
         # Update the list but skip the empty check to avoid recursion
         self.update_chat_list(skip_empty_check=True)
 
-    def generate_chat_id(self):
-        """Generate a unique chat ID"""
-        return f"chat_{int(time.time())}"
-
-    def save_current_chat(self):
-        """Save the current chat to a JSON file"""
-        if hasattr(self, 'current_chat_id') and (self.conversation_history or self.terminal_output):
-            chat_data = {
-                'id': self.current_chat_id,
-                'title': self.current_chat_title if hasattr(self, 'current_chat_title') else "New Chat",
-                'timestamp': time.time(),
-                'history': self.conversation_history,
-                'terminal_output': self.terminal_output  # Save terminal output
-            }
-            
-            # Create chats directory if it doesn't exist
-            os.makedirs(CHAT_DIR, exist_ok=True)
-            
-            # Save to JSON file
-            with open(os.path.join(CHAT_DIR, f"{self.current_chat_id}.json"), 'w') as f:
-                json.dump(chat_data, f, indent=2)
+    def save_current_chat(self, on_saved=None):
+        """Queue a save of the current chat; on_saved is called on the saver thread once it is written"""
+        if self.session.history or self.terminal_output:
+            self.chat_saver.save(self.session.chat_id, self.session.title, self.session.history, self.terminal_output,
+                                 on_saved=on_saved)
+
+            # Index any new exchanges for similar-command suggestions
+            if self.exchange_index is not None:
+                self.exchange_index.update_chat(self.session.chat_id, self.session.history)
 
     def load_chat(self, chat_id):
         """Load a chat from its JSON file"""
         # Kill any running process before loading new chat
-        if self.current_process:
+        if self.command_runner.process:
             self.kill_current_process()
             
         try:
-            chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-            if not os.path.exists(chat_file):
-                print(f"Chat file not found: {chat_file}")
+            # A save of this chat that is still queued wins over the file on disk
+            chat_data = self.chat_saver.load(chat_id)
+            if chat_data is None:
+                print(f"Chat file not found: {self.chat_store.path(chat_id)}")
                 return
             
-            with open(chat_file, 'r') as f:
-                chat_data = json.load(f)
-            
-            self.current_chat_id = chat_data['id']
-            self.current_chat_title = chat_data.get('title', "Untitled Chat")
-            self.conversation_history = chat_data['history']
+            self.session.load(chat_data['id'], chat_data.get('title', "Untitled Chat"), chat_data['history'])
             self.terminal_output = chat_data.get('terminal_output', [])  # Load terminal output with default empty list
             
             # Replay the conversation in the UI
@@ -979,8 +1204,8 @@ class LMStudioApp:
                     self.output_text.insert(tk.END, str(line) + "\n")
             
             # Replay the last exchange if exists
-            if self.conversation_history:
-                last_exchange = self.conversation_history[-1]
+            if self.session.history:
+                last_exchange = self.session.history[-1]
                 # Set the prompt
                 if 'prompt' in last_exchange:
                     self.prompt_text.insert(tk.END, last_exchange['prompt'])
@@ -1013,21 +1238,8 @@ class LMStudioApp:
         try:
             self.history_list.delete(0, tk.END)
             
-            # Get all chat files
-            chat_files = glob.glob(os.path.join(CHAT_DIR, "*.json"))
-            self.chats = []
-            
-            for file in chat_files:
-                try:
-                    with open(file, 'r') as f:
-                        chat_data = json.load(f)
-                        self.chats.append((chat_data['timestamp'], chat_data['title'], chat_data['id']))
-                except Exception as e:
-                    logging.error(f"Failed to read chat file {file}: {str(e)}")
-                    continue
-            
-            # Sort by timestamp (newest first)
-            self.chats.sort(reverse=True)
+            # All saved chats, newest first
+            self.chats = self.chat_store.list_chats()
             
             # Update listbox
             if self.chats:
@@ -1035,9 +1247,9 @@ class LMStudioApp:
                     self.history_list.insert(tk.END, title)
                 
                 # Select current chat if it exists
-                if hasattr(self, 'current_chat_id') and self.current_chat_id:
+                if self.session.chat_id:
                     for i, (_, _, chat_id) in enumerate(self.chats):
-                        if chat_id == self.current_chat_id:
+                        if chat_id == self.session.chat_id:
                             self.history_list.selection_clear(0, tk.END)
                             self.history_list.selection_set(i)
                             self.history_list.see(i)
@@ -1063,7 +1275,7 @@ class LMStudioApp:
             # Load the clicked chat
             if hasattr(self, 'chats') and clicked_index < len(self.chats):
                 _, _, chat_id = self.chats[clicked_index]
-                if chat_id != self.current_chat_id:  # Only load if different chat selected
+                if chat_id != self.session.chat_id:  # Only load if different chat selected
                     self.save_current_chat()  # Save current chat before loading new one
                     self.load_chat(chat_id)
         
@@ -1077,7 +1289,7 @@ class LMStudioApp:
                 index = selection[0]
                 if index < len(self.chats):
                     _, _, chat_id = self.chats[index]
-                    if chat_id != self.current_chat_id:  # Only load if different chat selected
+                    if chat_id != self.session.chat_id:  # Only load if different chat selected
                         self.save_current_chat()  # Save current chat before loading new one
                         self.load_chat(chat_id)
             except Exception as e:
@@ -1106,23 +1318,20 @@ class LMStudioApp:
                 return
                 
             # Track if we're deleting the current chat
-            is_deleting_current = self.current_chat_id in selected_chat_ids
+            is_deleting_current = self.session.chat_id in selected_chat_ids
             
             # Delete the files
-            for chat_id in selected_chat_ids:
-                chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-                try:
-                    if os.path.exists(chat_file):
-                        os.remove(chat_file)
-                        logging.info(f"Deleted chat file: {chat_file}")
-                except Exception as e:
-                    logging.error(f"Failed to delete chat file {chat_file}: {str(e)}")
-                    messagebox.showerror("Error", f"Failed to delete chat: {str(e)}")
-            
-            # Update the list before potentially starting a new chat
-            remaining_files = glob.glob(os.path.join(CHAT_DIR, "*.json"))
+            try:
+                self.chat_saver.discard(selected_chat_ids)
+                self.chat_store.delete_many(selected_chat_ids)
+            except Exception as e:
+                logging.error(f"Failed to delete chats {selected_chat_ids}: {str(e)}")
+                messagebox.showerror("Error", f"Failed to delete chat: {str(e)}")
+            if self.exchange_index is not None:
+                for chat_id in selected_chat_ids:
+                    self.exchange_index.remove_chat(chat_id)
             
-            if not remaining_files or is_deleting_current:
+            if not self.chat_store.count() or is_deleting_current:
                 # No chats left or current chat was deleted - start fresh
                 self.initialize_new_chat()
             else:
@@ -1143,15 +1352,12 @@ class LMStudioApp:
             
         try:
             # Delete all chat files
-            deleted_files = False
-            for file in glob.glob(os.path.join(CHAT_DIR, "*.json")):
-                try:
-                    os.remove(file)
-                    deleted_files = True
-                    logging.info(f"Deleted chat file: {file}")
-                except Exception as e:
-                    logging.error(f"Failed to delete file {file}: {str(e)}")
+            self.chat_saver.discard()
+            self.chat_store.clear()
             
+            if self.exchange_index is not None:
+                self.exchange_index.clear()
+
             # Always start fresh after clearing all chats
             self.initialize_new_chat()
             
@@ -1159,9 +1365,28 @@ class LMStudioApp:
             logging.error(f"Error in clear_all_chats: {str(e)}")
             messagebox.showerror("Error", f"Failed to clear chats: {str(e)}")
 
+    def on_close(self):
+        """Save the current chat and close the window once every pending save is on disk"""
+        try:
+            self.save_current_chat()
+        except Exception as e:
+            logging.error(f"Failed to save chat on exit: {str(e)}")
+        # Poll instead of joining the saver so the main loop keeps serving its root.after calls
+        self.root.withdraw()
+        self.wait_for_saves(time.monotonic() + 10)
+
+    def wait_for_saves(self, deadline):
+        if self.chat_saver.flush(timeout=0) or time.monotonic() > deadline:
+            self.chat_saver.close(timeout=1)
+            self.root.destroy()
+        else:
+            self.root.after(50, self.wait_for_saves, deadline)
+
 
 if __name__ == "__main__":
     try:
+        ensure_app_directories()
+        redirect_output(LOG_DIR)
         setup_logging(LOG_DIR)
         logging.info("Initializing main window")
         
@@ -0,0 +1,44 @@
+"""
+UI-independent core of AIPrompt: provider calls, chat sessions, chat persistence and
+command execution. LMStudioApp in AIPrompt.py is a Tk client of these classes, and
+batch mode uses them without any UI.
+
+Importing the package has no side effects (no directories, logging setup or stream
+redirection) and never imports tkinter. Submodules are loaded on first attribute
+access, and httpx/openai only when a provider is first used, so entry points that
+don't need them start fast (see test/check_import_time.py).
+"""
+import importlib
+
+_EXPORTS = {
+    "ProviderEngine": "providers",
+    "LatencyPolicy": "providers",
+    "LMStudioServerPool": "providers",
+    "LMStudioTransport": "providers",
+    "OpenAIClientCache": "providers",
+    "ChatSession": "session",
+    "ChatStore": "store",
+    "open_chat_store": "store",
+    "SQLiteChatStore": "sqlite_store",
+    "ChatSaver": "persistence",
+    "CommandRunner": "commands",
+    "ContextWindow": "context",
+    "ModelListCache": "caches",
+    "ResponseCache": "caches",
+    "ExchangeIndex": "similarity",
+    "RequestMetrics": "metrics",
+    "ShellResponseStreamParser": "parsing",
+    "app_directories": "config",
+    "ensure_app_directories": "config",
+    "setup_logging": "config",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
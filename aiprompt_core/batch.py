@@ -0,0 +1,161 @@
+"""
+Headless batch mode: runs a file of prompts concurrently and writes the results as JSON lines.
+Used by AIPrompt.py --batch, or directly with python -m aiprompt_core.batch --batch FILE.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from .config import ensure_app_directories, setup_logging
+from .providers import LatencyPolicy, ProviderEngine
+from .session import ChatSession
+
+def read_batch_prompts(source):
+    """
+    Reads batch prompts from a file, or stdin when source is '-'. Each line is a prompt,
+    or a JSON object with a "prompt" key; blank lines and lines starting with '#' are skipped.
+    """
+    stream = sys.stdin if source == "-" else open(source, 'r', encoding='utf-8')
+    try:
+        prompts = []
+        for line in stream:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    line = str(json.loads(line)["prompt"]).strip()
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    pass
+            prompts.append(line)
+        return prompts
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+async def run_batch(engine, prompts, provider, model, out, concurrency=4, server_url=None, api_key=None, is_windows=None):
+    """
+    Sends every prompt through ChatSession with at most concurrency requests in flight,
+    writing one JSON record per prompt to out as soon as it completes.
+    Returns the summary statistics.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"ok": 0, "failed": 0, "latencies": [], "completion_tokens": 0}
+
+    async def run_one(index, prompt):
+        async with semaphore:
+            # Prompts are independent, so each gets an empty conversation
+            session = ChatSession(engine, is_windows=is_windows)
+            metrics = {}
+            start = time.perf_counter()
+            if provider == "LM Studio":
+                response = await session.send_lm_studio_prompt(model, prompt, server_url, commit=False, metrics=metrics)
+            else:
+                response = await session.send_openai_prompt(model, prompt, api_key, commit=False, metrics=metrics)
+            latency = time.perf_counter() - start
+
+        response = response or {}
+        record = {
+            "index": index,
+            "prompt": prompt,
+            "zsh": response.get("zsh", ""),
+            "powershell": response.get("powershell", ""),
+            "instructions": response.get("instructions", ""),
+            "title": response.get("title", ""),
+            "latency": round(latency, 3),
+        }
+        if not response or response.get("error"):
+            record["error"] = response.get("instructions") or "No response or invalid response from AI"
+            stats["failed"] += 1
+        else:
+            stats["ok"] += 1
+        stats["latencies"].append(latency)
+        stats["completion_tokens"] += metrics.get("completion_tokens") or 0
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    await asyncio.gather(*(run_one(i, prompt) for i, prompt in enumerate(prompts)))
+    return stats
+
+def batch_main(argv):
+    """
+    Entry point for --batch: runs a file of prompts without creating a Tk root.
+    """
+    # Batch output goes to the terminal, not to log files stdout/stderr may have been redirected to
+    sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    parser = argparse.ArgumentParser(
+        prog="AIPrompt",
+        description="Generate shell commands for a file of prompts and write them as JSON lines."
+    )
+    parser.add_argument("--batch", required=True, metavar="FILE", help="prompt file, one prompt per line ('-' reads stdin)")
+    parser.add_argument("--provider", choices=["LM Studio", "OpenAI"], default="LM Studio")
+    parser.add_argument("--model", help="model ID (default: the first model the provider lists)")
+    parser.add_argument("--server-url", default="http://localhost:1234", help="LM Studio server URL(s), comma separated")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""), help="OpenAI API key (default: $OPENAI_API_KEY)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once (default: 4)")
+    parser.add_argument("--output", default="-", metavar="FILE", help="JSONL output file (default: stdout)")
+    parser.add_argument("--os", choices=["windows", "unix"], help="target shell (default: this machine's)")
+    args = parser.parse_args(argv)
+
+    log_dir, _, cache_dir = ensure_app_directories()
+    setup_logging(log_dir)
+    try:
+        prompts = read_batch_prompts(args.batch)
+    except OSError as e:
+        print(f"Could not read prompts: {e}", file=sys.stderr)
+        return 1
+    if not prompts:
+        print("No prompts to run.", file=sys.stderr)
+        return 1
+
+    try:
+        out = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf-8')
+    except OSError as e:
+        print(f"Could not open output file: {e}", file=sys.stderr)
+        return 1
+    engine = ProviderEngine(latency_path=os.path.join(cache_dir, "latency.json"))
+    try:
+        model = args.model
+        if not model:
+            try:
+                models = engine.run(engine.list_models(args.provider, server_url=args.server_url, api_key=args.api_key), timeout=30)
+            except Exception as e:
+                logging.error(f"Failed to list {args.provider} models: {e}")
+                print(f"Could not list models from {args.provider}: {e}", file=sys.stderr)
+                return 1
+            if not models:
+                print(f"No models available from {args.provider}.", file=sys.stderr)
+                return 1
+            model = models[0]
+        print(f"Running {len(prompts)} prompts on {args.provider} {model} (concurrency {args.concurrency})", file=sys.stderr)
+
+        is_windows = None if args.os is None else args.os == "windows"
+        started = time.perf_counter()
+        stats = engine.run(run_batch(
+            engine, prompts, args.provider, model, out,
+            concurrency=max(1, args.concurrency),
+            server_url=args.server_url,
+            api_key=args.api_key,
+            is_windows=is_windows
+        ))
+        elapsed = time.perf_counter() - started
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        engine.shutdown()
+
+    latencies = stats["latencies"]
+    print(f"{len(prompts)} prompts: {stats['ok']} ok, {stats['failed']} failed in {elapsed:.2f}s "
+          f"({len(prompts) / elapsed:.2f} prompts/s)", file=sys.stderr)
+    print(f"Latency: mean {sum(latencies) / len(latencies):.2f}s, p50 {LatencyPolicy.percentile(latencies, 50):.2f}s, "
+          f"p95 {LatencyPolicy.percentile(latencies, 95):.2f}s", file=sys.stderr)
+    if stats["completion_tokens"]:
+        print(f"Completion tokens: {stats['completion_tokens']} ({stats['completion_tokens'] / elapsed:.1f} tok/s overall)", file=sys.stderr)
+    return 0 if stats["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(batch_main(sys.argv[1:]))
@@ -0,0 +1,169 @@
+"""
+On-disk caches for model lists and prompt responses.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .config import MODEL_CACHE_TTL
+
+class ModelListCache:
+    """
+    Persists the last-known model list and selected model per provider/server
+    so the model dropdown can be filled instantly at startup.
+    """
+    def __init__(self, path, ttl=MODEL_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to read model cache {self.path}: {e}")
+
+    @staticmethod
+    def make_key(provider, source):
+        return f"{provider}|{source.strip().rstrip('/')}"
+
+    def get(self, provider, source):
+        """Return the cached entry ({models, selected, fetched_at}) or None."""
+        with self.lock:
+            entry = self.entries.get(self.make_key(provider, source))
+            return dict(entry) if entry else None
+
+    def is_fresh(self, entry):
+        return bool(entry) and time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def store_models(self, provider, source, models):
+        with self.lock:
+            entry = self.entries.setdefault(self.make_key(provider, source), {})
+            entry["models"] = list(models)
+            entry["fetched_at"] = time.time()
+            self._save()
+
+    def store_selection(self, provider, source, model):
+        with self.lock:
+            entry = self.entries.setdefault(self.make_key(provider, source), {})
+            if entry.get("selected") == model:
+                return
+            entry["selected"] = model
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to write model cache {self.path}: {e}")
+
+class ResponseCache:
+    """
+    Opt-in on-disk cache of structured responses for repeated prompts.
+    Entries are JSON files in the cache directory; a small index keeps them in
+    least-recently-used order and bounds the cache by entry count and total size.
+    Hits only reorder the index in memory; it is written on put (and eviction) and by
+    flush(), which should be called before exiting.
+    """
+    def __init__(self, directory, max_entries=500, max_bytes=20 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.index = OrderedDict()  # key -> entry size in bytes, oldest first
+        self.dirty = False  # the index changed since it was last written
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_path, 'r') as f:
+                for key, size in json.load(f):
+                    self.index[key] = size
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to read response cache index: {e}")
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split())
+
+    @classmethod
+    def make_key(cls, provider, model, system_prompt, history, prompt):
+        """Hash of everything that determines the model's answer."""
+        material = {
+            "provider": provider,
+            "model": model,
+            "system": system_prompt,
+            "history": [[cls.normalize(ex.get("prompt", "")), ex.get("response")] for ex in history],
+            "prompt": cls.normalize(prompt),
+        }
+        blob = json.dumps(material, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.index:
+                return None
+            try:
+                with open(self.entry_path(key), 'r') as f:
+                    response = json.load(f)
+            except Exception as e:
+                logging.error(f"Dropping unreadable response cache entry {key}: {e}")
+                self.index.pop(key, None)
+                self.dirty = True
+                return None
+            self.index.move_to_end(key)
+            self.dirty = True
+            return response
+
+    def put(self, key, response):
+        data = json.dumps(response).encode("utf-8")
+        with self.lock:
+            try:
+                with open(self.entry_path(key), 'wb') as f:
+                    f.write(data)
+            except Exception as e:
+                logging.error(f"Failed to write response cache entry: {e}")
+                return
+            self.index[key] = len(data)
+            self.index.move_to_end(key)
+            self._evict()
+            self._save_index()
+
+    def flush(self):
+        """Writes the index if hits reordered it since the last write."""
+        with self.lock:
+            if self.dirty:
+                self._save_index()
+
+    def _evict(self):
+        total = sum(self.index.values())
+        while self.index and (len(self.index) > self.max_entries or total > self.max_bytes):
+            key, size = self.index.popitem(last=False)
+            total -= size
+            try:
+                os.remove(self.entry_path(key))
+            except OSError:
+                pass
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self.index.items()), f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+        except Exception as e:
+            logging.error(f"Failed to write response cache index: {e}")
@@ -0,0 +1,122 @@
+"""
+Running recommended shell commands.
+"""
+import os
+import platform
+import signal
+import subprocess
+import threading
+
+class CommandRunner:
+    """
+    Runs one shell command at a time: ZSH/sh in its own process group on Unix, a hidden
+    PowerShell on Windows. Output lines are read on a background thread and passed to
+    callbacks, so callers must marshal them onto their UI thread themselves.
+    """
+    MAX_CAPTURED_LINES = 1000  # Maximum lines of output kept for the chat history
+
+    def __init__(self, is_windows=None):
+        self.is_windows = platform.system().lower().startswith('win') if is_windows is None else is_windows
+        self.process = None
+        self.running = False
+
+    def spawn(self, command):
+        if self.is_windows:
+            # For Windows, use hidden PowerShell window
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+
+            return subprocess.Popen(
+                ["powershell", "-NoProfile", "-WindowStyle", "Hidden", "-Command", command],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+                startupinfo=startupinfo
+            )
+        # For Unix/Mac, use process group
+        return subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            preexec_fn=os.setsid
+        )
+
+    def start(self, command, on_line, on_exit):
+        """
+        Runs command on a background thread. on_line(line) receives each output line as it
+        arrives; on_exit(output, error) is called once at the end with the captured lines
+        (at most MAX_CAPTURED_LINES) and the error message if the command could not run.
+        """
+        self.running = True
+
+        def run_command():
+            output_buffer = []
+            error = None
+            try:
+                process = self.spawn(command)
+                self.process = process
+
+                while self.running:
+                    line = process.stdout.readline()
+                    if not line and process.poll() is not None:
+                        break
+                    if line:
+                        # Add to buffer if not too large
+                        if len(output_buffer) < self.MAX_CAPTURED_LINES:
+                            output_buffer.append(line.rstrip())
+                        on_line(line.rstrip())
+
+                # If process is still running when loop exits, terminate it
+                if process.poll() is None:
+                    self.kill()
+            except Exception as e:
+                error = str(e)
+            finally:
+                self.process = None
+                self.running = False
+            on_exit(output_buffer, error)
+
+        threading.Thread(target=run_command, daemon=True).start()
+
+    def kill(self):
+        """
+        Kill the running command and all its children.
+        Returns False if no command was running; raises if it could not be killed.
+        """
+        process = self.process
+        if process is None:
+            return False
+        try:
+            self.running = False
+
+            if self.is_windows:
+                try:
+                    # On Windows, first try to gracefully terminate PowerShell
+                    subprocess.run(
+                        ["powershell", "-Command", "Get-Process -Id " + str(process.pid) + " | Stop-Process -Force"],
+                        timeout=2
+                    )
+                except:
+                    # If that fails, use psutil as backup
+                    try:
+                        import psutil
+                        parent = psutil.Process(process.pid)
+                        for child in parent.children(recursive=True):
+                            try:
+                                child.terminate()
+                            except:
+                                child.kill()
+                        parent.terminate()
+                    except:
+                        # Last resort: force kill
+                        process.kill()
+            else:
+                # On Unix, kill the process group
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+        finally:
+            self.process = None
+        return True
@@ -0,0 +1,90 @@
+"""
+Application paths and provider settings shared by the GUI, batch mode and the engine.
+Importing this module has no side effects: directories are only created by
+ensure_app_directories() and logging is only configured by setup_logging().
+"""
+import logging
+import os
+import platform
+
+def app_directories():
+    """
+    Returns (log_dir, chat_dir, cache_dir) for this platform without creating them.
+    """
+    if platform.system().lower().startswith('win'):
+        # Use AppData for Windows
+        base_dir = os.path.join(os.environ.get('APPDATA', ''), 'AIPrompt')
+    else:
+        # Use Application Support for macOS (more standard than Library)
+        base_dir = os.path.expanduser("~/Library/Application Support/AIPrompt")
+
+    # Standard subdirectories
+    log_dir = os.path.join(base_dir, 'Logs')
+    chat_dir = os.path.join(base_dir, 'Chats')
+    cache_dir = os.path.join(base_dir, 'Cache')
+    return log_dir, chat_dir, cache_dir
+
+def ensure_app_directories():
+    """
+    Creates the application directories if they are missing and returns them.
+    """
+    directories = app_directories()
+    for directory in directories:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except Exception as e:
+            print(f"Error creating directory {directory}: {e}")
+            logging.error(f"Error creating directory {directory}: {e}")
+    return directories
+
+def setup_logging(log_dir):
+    log_file = os.path.join(log_dir, "aiprompt.log")
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    logging.info("Starting AIPrompt application")
+
+# How long a cached model list is trusted before it is revalidated in the background
+MODEL_CACHE_TTL = 10 * 60
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Loading a model into LM Studio can take far longer than a normal completion
+MODEL_WARM_UP_TIMEOUT = 180
+# While idle, ping the selected LM Studio model this often so it is not unloaded
+MODEL_KEEP_ALIVE_INTERVAL = 5 * 60
+
+# Structured output schema shared by both providers. Kept as module constants so every
+# request carries a byte-identical prefix that server-side prompt caches can reuse.
+SHELL_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "powershell": {
+            "type": "string",
+            "description": "ONLY the exact PowerShell commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
+        },
+        "zsh": {
+            "type": "string",
+            "description": "ONLY the exact ZSH commands to execute. No comments, no explanations, no backticks. If no command is needed, use empty string."
+        },
+        "instructions": {
+            "type": "string",
+            "description": "All explanations, context, examples, and command descriptions go here. Use Markdown formatting."
+        },
+        "title": {
+            "type": "string",
+            "description": "A short, descriptive title for this chat exchange (max 50 characters)"
+        }
+    },
+    "required": ["powershell", "zsh", "instructions", "title"]
+}
+LM_STUDIO_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "shell_response",
+        "strict": "true",
+        "schema": SHELL_RESPONSE_SCHEMA
+    }
+}
+OPENAI_RESPONSE_FORMAT = {"type": "json_object", "schema": SHELL_RESPONSE_SCHEMA}
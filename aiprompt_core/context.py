@@ -0,0 +1,100 @@
+"""
+Token budgeting for replayed chat history.
+"""
+import json
+
+# Context window sizes in tokens, matched by model-name prefix (longest prefix wins).
+# Models not listed fall back to the provider default.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+PROVIDER_CONTEXT_BUDGETS = {"LM Studio": 4096, "OpenAI": 16385}
+
+class ContextWindow:
+    """
+    Keeps the replayed conversation within a per-model token budget.
+    Tokens are estimated at ~4 characters each plus a small per-message overhead,
+    which is close enough for budgeting without a tokenizer dependency.
+    The system prompt and current prompt are always kept; older turns are dropped first.
+    """
+    CHARS_PER_TOKEN = 4
+    MESSAGE_OVERHEAD = 4
+    # When history overflows, trim it down to this share of the space in one block so
+    # several more turns fit before the replayed prefix has to change again
+    TRIM_TARGET = 0.5
+
+    def __init__(self, model_budgets=None, provider_budgets=None):
+        self.model_budgets = dict(MODEL_CONTEXT_BUDGETS if model_budgets is None else model_budgets)
+        self.provider_budgets = dict(PROVIDER_CONTEXT_BUDGETS if provider_budgets is None else provider_budgets)
+
+    def budget_for(self, provider, model):
+        name = model.lower()
+        # Ignore any publisher prefix such as "lmstudio-community/"
+        name = name.rsplit("/", 1)[-1]
+        matches = [prefix for prefix in self.model_budgets if name.startswith(prefix)]
+        if matches:
+            return self.model_budgets[max(matches, key=len)]
+        return self.provider_budgets.get(provider, 4096)
+
+    @classmethod
+    def estimate_tokens(cls, message):
+        return len(message["content"]) // cls.CHARS_PER_TOKEN + cls.MESSAGE_OVERHEAD
+
+    @staticmethod
+    def compact_response(response, shell_key, summary_chars=240):
+        """
+        Compact encoding of a past assistant turn for replay: only the proposed command
+        and a trimmed instructions summary, without the title or the empty opposite-OS field.
+        """
+        if not isinstance(response, dict):
+            return json.dumps(response)
+        summary = " ".join(str(response.get("instructions", "")).split())
+        if len(summary) > summary_chars:
+            summary = summary[:summary_chars].rsplit(" ", 1)[0] + "..."
+        compact = {shell_key: response.get(shell_key, ""), "instructions": summary}
+        return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+    def fit(self, provider, model, system_message, turns, user_message, reserve=0, start=0):
+        """
+        Builds the message list from the system message, history turns (lists of
+        messages, oldest first) and the new user message, replaying turns from start on.
+        If that exceeds the budget minus the reserved output tokens, the oldest turns are
+        dropped in one block down to TRIM_TARGET of the space, so the replayed prefix stays
+        the same for the next few prompts and server-side prompt caches keep hitting.
+        Returns (messages, report) where report has budget, used, dropped_turns,
+        dropped_tokens, trimmed_turns (dropped by this call) and start (pass it next time).
+        """
+        budget = self.budget_for(provider, model) - reserve
+        fixed = self.estimate_tokens(system_message) + self.estimate_tokens(user_message)
+        turn_tokens = [sum(self.estimate_tokens(m) for m in turn) for turn in turns]
+
+        available = budget - fixed
+        start = min(start, len(turns))
+        kept_from = start
+        used = sum(turn_tokens[start:])
+        if used > available:
+            target = available * self.TRIM_TARGET
+            while kept_from < len(turns) and used > target:
+                used -= turn_tokens[kept_from]
+                kept_from += 1
+
+        messages = [system_message]
+        for turn in turns[kept_from:]:
+            messages.extend(turn)
+        messages.append(user_message)
+        report = {
+            "budget": budget,
+            "used": fixed + used,
+            "dropped_turns": kept_from,
+            "dropped_tokens": sum(turn_tokens[:kept_from]),
+            "trimmed_turns": kept_from - start,
+            "start": kept_from,
+        }
+        return messages, report
@@ -0,0 +1,105 @@
+"""
+Per-request timing log (metrics.jsonl) and rolling latency percentiles.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from .providers import LatencyPolicy
+
+class RequestMetrics:
+    """
+    Per-request latency and throughput figures. Each finished request becomes one JSON
+    line in a size-rotated metrics file, including rolling p50/p95 of the total time and
+    time to first token for that model. record() runs on the provider event loop, so it
+    only queues the row; a listener thread writes (and rotates) the file. close() drains it.
+    """
+    WINDOW = 200
+
+    def __init__(self, path, max_bytes=1024 * 1024, backup_count=3):
+        self.lock = threading.Lock()
+        self.windows = {}  # "provider|model" -> deque of (total_s, ttft_s)
+        self.logger = logging.getLogger("aiprompt.metrics")
+        self.logger.setLevel(logging.INFO)
+        # Rows go only to the metrics file, not to aiprompt.log
+        self.logger.propagate = False
+        self.listener = None
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            rows = queue.SimpleQueue()
+            self.logger.addHandler(QueueHandler(rows))
+            self.listener = QueueListener(rows, handler)
+            self.listener.start()
+
+    def close(self):
+        """Writes any queued rows and stops the writer thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    @staticmethod
+    def ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+    def record(self, provider, model, metrics):
+        """
+        Builds the row for a finished request from the metrics collected by the engine
+        (connect_s, ttft_s, total_s, tokens, parse_s, ...), writes it and returns it.
+        """
+        total = metrics.get("total_s")
+        ttft = metrics.get("ttft_s")
+        completion_tokens = metrics.get("completion_tokens")
+        generation_time = total - (ttft or 0.0) if total is not None else None
+        row = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "provider": provider,
+            "model": model,
+            "server": metrics.get("server"),
+            "attempts": metrics.get("attempts", 1),
+            "connect_ms": self.ms(metrics.get("connect_s", 0.0)),
+            "ttft_ms": self.ms(ttft),
+            "total_ms": self.ms(total),
+            "prompt_tokens": metrics.get("prompt_tokens"),
+            "completion_tokens": completion_tokens,
+            "cached_tokens": metrics.get("cached_tokens"),
+            "tokens_per_s": round(completion_tokens / generation_time, 1) if completion_tokens and generation_time else None,
+            "parse_ms": self.ms(metrics.get("parse_s")),
+        }
+        with self.lock:
+            window = self.windows.setdefault(f"{provider}|{model}", deque(maxlen=self.WINDOW))
+            window.append((total, ttft))
+            totals = [t for t, _ in window if t is not None]
+            ttfts = [f for _, f in window if f is not None]
+        row["p50_total_ms"] = self.ms(LatencyPolicy.percentile(totals, 50)) if totals else None
+        row["p95_total_ms"] = self.ms(LatencyPolicy.percentile(totals, 95)) if totals else None
+        row["p50_ttft_ms"] = self.ms(LatencyPolicy.percentile(ttfts, 50)) if ttfts else None
+        row["p95_ttft_ms"] = self.ms(LatencyPolicy.percentile(ttfts, 95)) if ttfts else None
+        self.logger.info(json.dumps(row))
+        return row
+
+    @staticmethod
+    def summary(row):
+        """One-line text for the status bar."""
+        parts = [f"{row['provider']} {row['model']}"]
+        parts.append(f"connect {row['connect_ms']:.0f} ms")
+        if row["ttft_ms"] is not None:
+            parts.append(f"first token {row['ttft_ms']:.0f} ms")
+        parts.append(f"total {row['total_ms'] / 1000:.2f} s")
+        if row["prompt_tokens"] is not None or row["completion_tokens"] is not None:
+            tokens = f"tokens {row['prompt_tokens'] or '?'} in / {row['completion_tokens'] or '?'} out"
+            if row["cached_tokens"]:
+                tokens += f" ({row['cached_tokens']} cached)"
+            parts.append(tokens)
+        if row["tokens_per_s"] is not None:
+            parts.append(f"{row['tokens_per_s']:.1f} tok/s")
+        if row["parse_ms"] is not None:
+            parts.append(f"parse {row['parse_ms']:.1f} ms")
+        parts.append(f"p50 {row['p50_total_ms'] / 1000:.2f} s / p95 {row['p95_total_ms'] / 1000:.2f} s")
+        if row["attempts"] > 1:
+            parts.append(f"{row['attempts']} attempts")
+        return " | ".join(parts)
@@ -0,0 +1,147 @@
+"""
+Incremental parsing of streamed shell_response JSON.
+"""
+import json
+
+class ShellResponseStreamParser:
+    """
+    Incremental parser for the shell_response JSON object, fed one streamed token at a time.
+    feed() returns a list of (kind, field, value) events:
+      ("delta", field, text)  - more decoded characters of a string field
+      ("field", field, value) - a field's value is complete
+    Anything before the opening brace or after the closing brace (e.g. ```json fences) is ignored.
+    """
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.state = "preamble"
+        self.fields = {}
+        self.complete = False
+        self.key = None
+        self.chars = []          # decoded characters of the current key or string value
+        self.value_start = 0     # index into chars not yet emitted as a delta
+        self.escape = None       # None, "" (after backslash) or collected \u hex digits
+        self.high_surrogate = None
+        self.skip_depth = 0      # nesting depth while skipping a non-string value
+        self.skip_in_string = False
+        self.skip_escape = False
+        self.skip_chars = []
+
+    def feed(self, text):
+        events = []
+        for ch in text:
+            self._consume(ch, events)
+        if self.state == "value" and len(self.chars) > self.value_start:
+            events.append(("delta", self.key, "".join(self.chars[self.value_start:])))
+            self.value_start = len(self.chars)
+        return events
+
+    def _consume(self, ch, events):
+        state = self.state
+        if state == "preamble":
+            if ch == "{":
+                self.state = "key_wait"
+        elif state == "key_wait":
+            if ch == '"':
+                self.chars = []
+                self.state = "key"
+            elif ch == "}":
+                self.complete = True
+                self.state = "done"
+        elif state in ("key", "value"):
+            self._consume_string_char(ch, events)
+        elif state == "colon":
+            if ch == ":":
+                self.state = "value_wait"
+        elif state == "value_wait":
+            if ch == '"':
+                self.chars = []
+                self.value_start = 0
+                self.state = "value"
+            elif not ch.isspace():
+                self.skip_depth = 0
+                self.skip_in_string = False
+                self.skip_escape = False
+                self.skip_chars = []
+                self.state = "skip"
+                self._consume_skipped(ch, events)
+        elif state == "skip":
+            self._consume_skipped(ch, events)
+        elif state == "after_value":
+            if ch == ",":
+                self.state = "key_wait"
+            elif ch == "}":
+                self.complete = True
+                self.state = "done"
+
+    def _consume_string_char(self, ch, events):
+        if self.escape is not None:
+            if self.escape == "":
+                if ch == "u":
+                    self.escape = "u"
+                    return
+                self._append(self.ESCAPES.get(ch, ch))
+                self.escape = None
+                return
+            self.escape += ch
+            if len(self.escape) == 5:
+                code = int(self.escape[1:], 16)
+                self.escape = None
+                if 0xD800 <= code <= 0xDBFF:
+                    self.high_surrogate = code
+                elif 0xDC00 <= code <= 0xDFFF and self.high_surrogate is not None:
+                    self._append(chr(0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+                else:
+                    self._append(chr(code))
+            return
+        if ch == "\\":
+            self.escape = ""
+        elif ch == '"':
+            self._close_string(events)
+        else:
+            self._append(ch)
+
+    def _append(self, ch):
+        self.high_surrogate = None
+        self.chars.append(ch)
+
+    def _close_string(self, events):
+        text = "".join(self.chars)
+        if self.state == "key":
+            self.key = text
+            self.state = "colon"
+            return
+        if len(self.chars) > self.value_start:
+            events.append(("delta", self.key, text[self.value_start:]))
+        self.fields[self.key] = text
+        events.append(("field", self.key, text))
+        self.state = "after_value"
+
+    def _consume_skipped(self, ch, events):
+        """Skip over a non-string value (number, literal or nested structure)."""
+        if self.skip_in_string:
+            if self.skip_escape:
+                self.skip_escape = False
+            elif ch == "\\":
+                self.skip_escape = True
+            elif ch == '"':
+                self.skip_in_string = False
+            self.skip_chars.append(ch)
+            return
+        if self.skip_depth == 0 and ch in ",}":
+            raw = "".join(self.skip_chars).strip()
+            try:
+                self.fields[self.key] = json.loads(raw)
+                events.append(("field", self.key, self.fields[self.key]))
+            except json.JSONDecodeError:
+                pass
+            self.state = "key_wait" if ch == "," else "done"
+            self.complete = ch == "}"
+            return
+        if ch == '"':
+            self.skip_in_string = True
+        elif ch in "{[":
+            self.skip_depth += 1
+        elif ch in "}]":
+            self.skip_depth -= 1
+        self.skip_chars.append(ch)
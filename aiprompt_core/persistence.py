@@ -0,0 +1,149 @@
+"""
+Write-behind chat saving, so callers on a UI thread never wait for the disk.
+"""
+import hashlib
+import json
+import logging
+import threading
+
+class ChatSaver:
+    """
+    Saves chats to a ChatStore (or SQLiteChatStore) on one background thread.
+
+    save() copies the chat and returns immediately. Saves of a chat that is still
+    queued are coalesced into the newest one, and a save whose title, history and
+    terminal output hash the same as the last one written for that chat is skipped.
+    flush() waits for the queue to drain and close() flushes and stops the thread;
+    close() is safe to call more than once (e.g. from a window close handler and atexit);
+    saves made after it are written synchronously, and on_saved callbacks no longer run
+    since the UI they notify is going away.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.condition = threading.Condition()
+        self.pending = {}  # chat_id -> (title, history, terminal_output, callbacks), oldest first
+        self.writing = None  # (chat_id, title, history, terminal_output) being written
+        self.hashes = {}  # chat_id -> content hash of the last write
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="ChatSaver", daemon=True)
+        self.thread.start()
+
+    def save(self, chat_id, title, history, terminal_output, on_saved=None):
+        """
+        Queue a save of the chat. on_saved (if given) is called without arguments on the
+        saver thread once the chat is on disk, or its write was skipped as unchanged.
+        Only the lists are copied, so the caller must not change exchanges in place.
+        """
+        history = list(history)
+        terminal_output = list(terminal_output)
+        with self.condition:
+            if not self.closed:
+                callbacks = self.pending.pop(chat_id, (None, None, None, []))[3]
+                if on_saved is not None:
+                    callbacks.append(on_saved)
+                self.pending[chat_id] = (title, history, terminal_output, callbacks)
+                self.condition.notify_all()
+                return
+        self.write(chat_id, title, history, terminal_output, [])
+
+    def load(self, chat_id):
+        """
+        Returns the chat's saved data like store.load, but a save that is still queued or
+        being written wins over what is on disk. A chat read from disk has its content hash
+        recorded, so saving it again unchanged (e.g. when switching away) writes nothing.
+        """
+        with self.condition:
+            if chat_id in self.pending:
+                title, history, terminal_output, _ = self.pending[chat_id]
+            elif self.writing is not None and self.writing[0] == chat_id:
+                _, title, history, terminal_output = self.writing
+            else:
+                title = None
+        if title is None:
+            chat_data = self.store.load(chat_id)
+            if chat_data is not None:
+                digest = self.content_hash(chat_data.get('title'), chat_data.get('history', []),
+                                           chat_data.get('terminal_output', []))
+                with self.condition:
+                    if chat_id not in self.pending and (self.writing is None or self.writing[0] != chat_id):
+                        self.hashes[chat_id] = digest
+            return chat_data
+        return {
+            'id': chat_id,
+            'title': title,
+            'history': list(history),
+            'terminal_output': list(terminal_output)
+        }
+
+    def discard(self, chat_ids=None):
+        """
+        Drop queued saves of chats that are about to be deleted (all chats if chat_ids is
+        None), waiting for a write of one of them that has already started.
+        """
+        with self.condition:
+            if chat_ids is None:
+                self.pending.clear()
+                self.condition.wait_for(lambda: self.writing is None)
+                self.hashes.clear()
+                return
+            chat_ids = set(chat_ids)
+            for chat_id in chat_ids:
+                self.pending.pop(chat_id, None)
+            self.condition.wait_for(lambda: self.writing is None or self.writing[0] not in chat_ids)
+            for chat_id in chat_ids:
+                self.hashes.pop(chat_id, None)
+
+    def flush(self, timeout=None):
+        """Wait until every queued save is written. Returns False if timeout ran out first."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and self.writing is None, timeout)
+
+    def close(self, timeout=None):
+        """Flush and stop the saver thread. Returns False if timeout ran out first."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logging.error(f"Timed out saving chats; {len(self.pending)} chats not saved")
+            return False
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.closed)
+                if not self.pending:
+                    return
+                chat_id = next(iter(self.pending))
+                title, history, terminal_output, callbacks = self.pending.pop(chat_id)
+                if self.closed:
+                    callbacks = []
+                self.writing = (chat_id, title, history, terminal_output)
+            try:
+                self.write(chat_id, title, history, terminal_output, callbacks)
+            finally:
+                with self.condition:
+                    self.writing = None
+                    self.condition.notify_all()
+
+    @staticmethod
+    def content_hash(title, history, terminal_output):
+        return hashlib.sha256(json.dumps([title, history, terminal_output], default=str).encode('utf-8')).hexdigest()
+
+    def write(self, chat_id, title, history, terminal_output, callbacks):
+        try:
+            digest = self.content_hash(title, history, terminal_output)
+            if self.hashes.get(chat_id) != digest:
+                self.store.save(chat_id, title, history, terminal_output)
+                with self.condition:
+                    self.hashes[chat_id] = digest
+        except Exception as e:
+            logging.error(f"Failed to save chat {chat_id}: {str(e)}")
+            return
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Error after saving chat {chat_id}: {str(e)}")
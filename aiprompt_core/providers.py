@@ -0,0 +1,661 @@
+"""
+Provider I/O: pooled LM Studio transport and server pool, cached OpenAI clients,
+learned completion deadlines and the ProviderEngine event loop.
+
+httpx and openai are imported on first use so that importing the engine stays cheap
+for entry points that never reach a provider.
+"""
+import asyncio
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .config import MODEL_WARM_UP_TIMEOUT
+from .context import ContextWindow
+
+def http2_available():
+    """HTTP/2 support in httpx needs the optional 'h2' package."""
+    return importlib.util.find_spec("h2") is not None
+
+class LMStudioTransport:
+    """
+    Pooled keep-alive HTTP transport for LM Studio servers.
+    Holds one httpx.AsyncClient (connection pool) per server URL; pools for URLs that are
+    no longer configured are closed by retain(). Must only be used from the ProviderEngine loop.
+    """
+    def __init__(self, pool_maxsize=4):
+        self.pool_maxsize = pool_maxsize
+        self.clients = {}
+        self.url_stats = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(server_url):
+        return server_url.strip().rstrip('/')
+
+    def record_connect(self, base_url, seconds):
+        with self.lock:
+            stats = self.url_stats.get(base_url)
+            if stats is not None:
+                stats["connections"] += 1
+                stats["connect_time_total"] += seconds
+                stats["last_connect_time"] = seconds
+
+    def client_for(self, server_url):
+        """Return the pooled client and base URL for server_url, creating the pool on first use."""
+        import httpx
+        base_url = self.normalize(server_url)
+        with self.lock:
+            client = self.clients.get(base_url)
+            if client is None:
+                client = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize),
+                    headers={"Connection": "keep-alive"}
+                )
+                self.clients[base_url] = client
+                self.url_stats[base_url] = {"requests": 0, "connections": 0, "connect_time_total": 0.0, "last_connect_time": 0.0}
+            self.url_stats[base_url]["requests"] += 1
+        return client, base_url
+
+    def retain(self, base_urls):
+        """Close the pools of any server URL not in base_urls (e.g. after the URL field changed)."""
+        keep = {self.normalize(url) for url in base_urls}
+        with self.lock:
+            stale = [url for url in self.clients if url not in keep]
+            clients = [self.clients.pop(url) for url in stale]
+            for url in stale:
+                self.url_stats.pop(url, None)
+        for url, client in zip(stale, clients):
+            logging.info(f"LM Studio server {url} removed, closing its connection pool")
+            asyncio.get_running_loop().create_task(client.aclose())
+
+    def trace_extensions(self, base_url):
+        """Per-request httpcore trace hook that times new TCP connections."""
+        return {"trace": connection_trace(lambda seconds: self.record_connect(base_url, seconds))}
+
+    async def get(self, server_url, path, **kwargs):
+        client, base_url = self.client_for(server_url)
+        return await client.get(base_url + path, extensions=self.trace_extensions(base_url), **kwargs)
+
+    async def post(self, server_url, path, **kwargs):
+        client, base_url = self.client_for(server_url)
+        return await client.post(base_url + path, extensions=self.trace_extensions(base_url), **kwargs)
+
+    def stream(self, server_url, method, path, **kwargs):
+        """Async context manager yielding a streamed response."""
+        client, base_url = self.client_for(server_url)
+        return client.stream(method, base_url + path, extensions=self.trace_extensions(base_url), **kwargs)
+
+    def stats(self, server_url=None):
+        """Pool statistics for one server URL, or a list covering every open pool."""
+        with self.lock:
+            urls = [self.normalize(server_url)] if server_url else list(self.url_stats)
+            result = []
+            for url in urls:
+                stats = self.url_stats.get(url)
+                if stats is None:
+                    continue
+                connections = stats["connections"]
+                avg_connect = stats["connect_time_total"] / connections if connections else 0.0
+                result.append({
+                    "server_url": url,
+                    "requests": stats["requests"],
+                    "connections": connections,
+                    "reused": max(stats["requests"] - connections, 0),
+                    "last_connect_ms": round(stats["last_connect_time"] * 1000, 2),
+                    "avg_connect_ms": round(avg_connect * 1000, 2),
+                })
+        if server_url:
+            return result[0] if result else None
+        return result
+
+    async def aclose(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+            self.url_stats.clear()
+        for client in clients:
+            await client.aclose()
+
+class LMStudioServerPool:
+    """
+    A set of LM Studio endpoints (different machines or ports) with periodic health
+    probes against /v1/models. Requests go to the healthy endpoint with the fewest
+    outstanding requests that serves the model, failing over on connect errors.
+    """
+    HEALTH_CHECK_INTERVAL = 30
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.endpoints = OrderedDict()  # base_url -> {healthy, models, outstanding, last_error, checked_at}
+        self.health_task = None
+
+    @staticmethod
+    def parse_urls(text):
+        """Split a comma/whitespace separated list of server URLs, keeping order."""
+        urls = []
+        for part in text.replace(",", " ").split():
+            url = LMStudioTransport.normalize(part)
+            if url and url not in urls:
+                urls.append(url)
+        return urls
+
+    def configure(self, server_urls):
+        """Update the endpoint set from the Server URL field (runs on the engine loop)."""
+        urls = self.parse_urls(server_urls)
+        if list(self.endpoints) != urls:
+            for url in list(self.endpoints):
+                if url not in urls:
+                    del self.endpoints[url]
+            for url in urls:
+                # New endpoints are assumed healthy until a probe or request says otherwise
+                self.endpoints.setdefault(url, {"healthy": True, "models": None, "outstanding": 0, "last_error": None, "checked_at": 0.0})
+            self.endpoints = OrderedDict((url, self.endpoints[url]) for url in urls)
+            self.transport.retain(urls)
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.get_running_loop().create_task(self.run_health_checks())
+
+    async def probe(self, url):
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        try:
+            resp = await self.transport.get(url, "/v1/models", timeout=5)
+            resp.raise_for_status()
+            data = resp.json()
+            endpoint["models"] = [m["id"] for m in data.get("data", [])] if isinstance(data, dict) else []
+            if not endpoint["healthy"]:
+                logging.info(f"LM Studio server {url} is healthy again")
+            endpoint["healthy"] = True
+            endpoint["last_error"] = None
+        except Exception as e:
+            if endpoint["healthy"]:
+                logging.warning(f"LM Studio server {url} failed its health check: {e}")
+            endpoint["healthy"] = False
+            endpoint["last_error"] = str(e)
+        endpoint["checked_at"] = time.time()
+
+    async def probe_all(self):
+        await asyncio.gather(*(self.probe(url) for url in list(self.endpoints)))
+
+    async def run_health_checks(self):
+        while self.endpoints:
+            await asyncio.sleep(self.HEALTH_CHECK_INTERVAL)
+            await self.probe_all()
+
+    def models(self):
+        """Union of the models served by healthy endpoints, in endpoint order."""
+        models = []
+        for endpoint in self.endpoints.values():
+            if endpoint["healthy"]:
+                for model in endpoint["models"] or []:
+                    if model not in models:
+                        models.append(model)
+        return models
+
+    def candidates(self, model):
+        """
+        Endpoints to try for model: healthy ones serving it (or not yet probed), least
+        outstanding requests first, then unhealthy ones as a last resort.
+        """
+        order = list(self.endpoints)
+        serving = [url for url, ep in self.endpoints.items() if ep["models"] is None or model in ep["models"]]
+        healthy = [url for url in serving if self.endpoints[url]["healthy"]]
+        healthy.sort(key=lambda url: (self.endpoints[url]["outstanding"], order.index(url)))
+        return healthy + [url for url in serving if url not in healthy]
+
+    async def request(self, model, send):
+        """
+        Runs send(base_url) against the best endpoint for model, failing over to the
+        next candidate when the connection cannot be established.
+        """
+        import httpx
+        candidates = self.candidates(model)
+        if not candidates:
+            raise RuntimeError(f"No LM Studio server is serving model {model}")
+        last_error = None
+        for url in candidates:
+            endpoint = self.endpoints.get(url)
+            if endpoint is None:
+                continue
+            endpoint["outstanding"] += 1
+            try:
+                return await send(url)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                logging.warning(f"LM Studio server {url} unreachable, failing over: {e}")
+                endpoint["healthy"] = False
+                endpoint["last_error"] = str(e)
+                last_error = e
+            finally:
+                endpoint["outstanding"] -= 1
+        if last_error is None:
+            # Every candidate was dropped (e.g. the server list changed) before it could be tried
+            raise httpx.ConnectError(f"No healthy LM Studio server for model {model}")
+        raise last_error
+
+    async def aclose(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+        await self.transport.aclose()
+
+    def status(self):
+        return [
+            {"server_url": url, "healthy": ep["healthy"], "outstanding": ep["outstanding"],
+             "models": len(ep["models"] or []), "last_error": ep["last_error"]}
+            for url, ep in self.endpoints.items()
+        ]
+
+class OpenAIClientCache:
+    """
+    Reuses AsyncOpenAI client instances (and their warm HTTP connection pools) across prompts.
+    Clients are keyed by (api_key, base_url) and dropped explicitly via invalidate().
+    """
+    def __init__(self, loop=None, max_keepalive=5, keepalive_expiry=120):
+        self.loop = loop
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, api_key, base_url=None):
+        import httpx
+        import openai
+        key = (api_key, base_url)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                http_client = httpx.AsyncClient(
+                    http2=http2_available(),
+                    limits=httpx.Limits(
+                        max_keepalive_connections=self.max_keepalive,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    event_hooks={"request": [self.attach_trace]}
+                )
+                # Retries are handled by ProviderEngine with the learned deadlines
+                client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+                self.clients[key] = client
+            return client
+
+    @staticmethod
+    async def attach_trace(request):
+        # Times new connections opened by the SDK for the request metrics
+        request.extensions["trace"] = connection_trace()
+
+    def invalidate(self, api_key=None):
+        """Close and forget cached clients, either all of them or those for one API key."""
+        with self.lock:
+            keys = [k for k in self.clients if api_key is None or k[0] == api_key]
+            clients = [self.clients.pop(k) for k in keys]
+        # Clients are closed on the loop that owns their connections
+        if self.loop is not None and not self.loop.is_closed():
+            for client in clients:
+                asyncio.run_coroutine_threadsafe(client.close(), self.loop)
+
+class LatencyPolicy:
+    """
+    Learns completion deadlines per (provider, model) from a rolling window of observed
+    latencies. The deadline is SAFETY_FACTOR x the p99 time per output token x the expected
+    output tokens (p95 of recent replies, capped by max_tokens), never below the p99 total
+    latency, and clamped to [MIN_DEADLINE, MAX_DEADLINE]. Until MIN_SAMPLES replies have
+    been seen, the provider default applies. Samples persist across launches: record()
+    only marks them dirty and asks for a flush() at most every SAVE_INTERVAL seconds, which
+    the engine runs off its event loop; call flush() again before exiting.
+    """
+    WINDOW = 200
+    MIN_SAMPLES = 5
+    SAFETY_FACTOR = 1.5
+    MIN_DEADLINE = 10
+    MAX_DEADLINE = 600
+    DEFAULT_DEADLINES = {"LM Studio": 120, "OpenAI": 60}
+    MAX_RETRIES = 2
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 8
+    RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+    SAVE_INTERVAL = 30  # seconds between writes of the latency history
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # serializes file writes so an older snapshot can't land last
+        self.samples = {}  # "provider|model" -> deque of [seconds, completion_tokens]
+        self.dirty = False
+        self.saved_at = 0.0  # time.monotonic() of the last write
+        if path:
+            try:
+                with open(path, 'r') as f:
+                    for key, samples in json.load(f).items():
+                        self.samples[key] = deque(samples, maxlen=self.WINDOW)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.error(f"Failed to read latency history {path}: {e}")
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def record(self, provider, model, seconds, completion_tokens):
+        """Adds a sample. Returns True when the history is due to be written with flush()."""
+        with self.lock:
+            key = f"{provider}|{model}"
+            self.samples.setdefault(key, deque(maxlen=self.WINDOW)).append([round(seconds, 3), int(completion_tokens)])
+            self.dirty = True
+            return bool(self.path) and time.monotonic() - self.saved_at >= self.SAVE_INTERVAL
+
+    def deadline(self, provider, model, max_tokens=None):
+        """Returns (seconds, samples) where samples is how many replies the deadline was learned from."""
+        with self.lock:
+            samples = list(self.samples.get(f"{provider}|{model}", ()))
+        if len(samples) < self.MIN_SAMPLES:
+            return self.DEFAULT_DEADLINES.get(provider, 60), len(samples)
+
+        p99_latency = self.percentile([s[0] for s in samples], 99)
+        deadline = p99_latency
+        with_tokens = [s for s in samples if s[1] > 0]
+        if with_tokens:
+            per_token = self.percentile([s[0] / s[1] for s in with_tokens], 99)
+            expected_tokens = self.percentile([s[1] for s in with_tokens], 95)
+            if max_tokens:
+                expected_tokens = min(expected_tokens, max_tokens)
+            deadline = max(deadline, per_token * expected_tokens)
+        deadline *= self.SAFETY_FACTOR
+        return min(max(deadline, self.MIN_DEADLINE), self.MAX_DEADLINE), len(samples)
+
+    def backoff(self, attempt):
+        """Delay before retry number attempt (1-based): exponential with jitter, capped."""
+        return min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    @classmethod
+    def is_transient(cls, error):
+        """Errors worth retrying: timeouts, dropped connections, rate limits and 5xx responses."""
+        # A library that was never imported cannot have raised the error
+        httpx = sys.modules.get("httpx")
+        openai = sys.modules.get("openai")
+        if httpx is not None:
+            if isinstance(error, httpx.HTTPStatusError):
+                return error.response.status_code in cls.RETRY_STATUS_CODES
+            if isinstance(error, httpx.TransportError):
+                return True
+        if openai is not None:
+            if isinstance(error, openai.APIStatusError):
+                return error.status_code in cls.RETRY_STATUS_CODES
+            if isinstance(error, openai.APIConnectionError):
+                return True
+        return isinstance(error, asyncio.TimeoutError)
+
+    def flush(self):
+        """Writes the samples to path if any were recorded since the last write (blocking)."""
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = {key: list(samples) for key, samples in self.samples.items()}
+                self.dirty = False
+                self.saved_at = time.monotonic()
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.error(f"Failed to write latency history {self.path}: {e}")
+
+# Metrics dict of the provider request running in the current task (set by ProviderEngine.chat_completion)
+CURRENT_REQUEST_METRICS = contextvars.ContextVar("current_request_metrics", default=None)
+
+def connection_trace(on_connect=None):
+    """
+    Builds an httpcore trace callback that times new connections (TCP connect and TLS
+    handshake) and adds the time to the current request's metrics as connect_s.
+    on_connect, if given, receives the duration of each TCP connect.
+    """
+    started = {}
+
+    async def trace(event_name, info):
+        if event_name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+            started[event_name] = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            begun = started.pop(event_name.replace(".complete", ".started"), None)
+            if begun is None:
+                return
+            seconds = time.perf_counter() - begun
+            metrics = CURRENT_REQUEST_METRICS.get()
+            if metrics is not None:
+                metrics["connect_s"] = metrics.get("connect_s", 0.0) + seconds
+            if on_connect and event_name == "connection.connect_tcp.complete":
+                on_connect(seconds)
+
+    return trace
+
+class ProviderEngine:
+    """
+    Runs all provider I/O on a single background asyncio event loop.
+    Coroutines are submitted from any thread and come back as concurrent.futures.Future
+    objects the Tk side can poll or cancel; cancelling aborts the in-flight request
+    and closes its socket.
+    latency_path is where learned deadlines are kept between runs (None keeps them in memory).
+    """
+    def __init__(self, latency_path=None):
+        self.loop = asyncio.new_event_loop()
+        self.lmstudio_transport = LMStudioTransport()
+        self.lmstudio_pool = LMStudioServerPool(self.lmstudio_transport)
+        self.openai_clients = OpenAIClientCache(self.loop)
+        self.latency_policy = LatencyPolicy(latency_path)
+        # Optional callback(provider, model, attempt, delay, error), called on the engine loop before a retry
+        self.on_retry = None
+        self.thread = threading.Thread(target=self.loop.run_forever, name="provider-engine", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop and return its concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Blocking helper for code that is not on the Tk thread."""
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self):
+        self.openai_clients.invalidate()
+        self.run(self.lmstudio_pool.aclose(), timeout=5)
+        # Let half-consumed response streams finish closing before the loop stops
+        self.run(self.loop.shutdown_asyncgens(), timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.latency_policy.flush()
+
+    async def list_models(self, provider, server_url=None, api_key=None):
+        """
+        Returns the model IDs offered by LM Studio (every server listed in server_url) or OpenAI.
+        """
+        if provider == "LM Studio":
+            self.lmstudio_pool.configure(server_url)
+            await self.lmstudio_pool.probe_all()
+            if not any(ep["healthy"] for ep in self.lmstudio_pool.endpoints.values()):
+                raise RuntimeError(f"No LM Studio server reachable at {server_url}")
+            return self.lmstudio_pool.models()
+        # Listing through the cached client also warms its connection for the next prompt
+        client = self.openai_clients.get(api_key)
+        return [m.id async for m in client.models.list(timeout=10)]
+
+    async def chat_completion(self, provider, payload, server_url=None, api_key=None, on_token=None, usage=None, metrics=None):
+        """
+        Runs one chat completion and returns the assistant message text (or None).
+        payload is the provider request body (model, messages, response_format, ...).
+        If on_token is given, the completion is streamed and each token is passed to it.
+        If usage is a dict, it is filled with the token counts the provider reports.
+        If metrics is a dict, it is filled with connect_s, ttft_s, total_s, token counts,
+        attempts and (for LM Studio) the server that answered.
+        Each attempt must finish within the deadline learned by latency_policy; transient
+        failures are retried with exponential backoff unless tokens were already streamed.
+        """
+        model = payload.get("model", "")
+        usage = {} if usage is None else usage
+        metrics = {} if metrics is None else metrics
+        deadline, _ = self.latency_policy.deadline(provider, model, payload.get("max_tokens"))
+        streamed = []
+
+        def relay(token):
+            if not streamed:
+                streamed.append(time.perf_counter())
+            on_token(token)
+
+        # Connection traces report into this request's metrics through the context variable
+        context_token = CURRENT_REQUEST_METRICS.set(metrics)
+        attempt = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                metrics["connect_s"] = 0.0
+                try:
+                    if provider == "LM Studio":
+                        call = self.lm_studio_chat(server_url, payload, on_token and relay, usage, deadline)
+                    else:
+                        call = self.openai_chat(api_key, payload, on_token and relay, usage, deadline)
+                    text = await asyncio.wait_for(call, deadline)
+                except Exception as e:
+                    if attempt >= LatencyPolicy.MAX_RETRIES or streamed or not LatencyPolicy.is_transient(e):
+                        raise
+                    attempt += 1
+                    delay = self.latency_policy.backoff(attempt)
+                    if isinstance(e, asyncio.TimeoutError):
+                        deadline = min(deadline * 2, LatencyPolicy.MAX_DEADLINE)
+                    logging.warning(f"{provider} {model} attempt {attempt} failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s")
+                    if self.on_retry:
+                        self.on_retry(provider, model, attempt, delay, e)
+                    await asyncio.sleep(delay)
+                    continue
+                total = time.perf_counter() - start
+                tokens = usage.get("completion_tokens") or len(text or "") // ContextWindow.CHARS_PER_TOKEN
+                if self.latency_policy.record(provider, model, total, tokens):
+                    # Disk I/O stays off the event loop
+                    self.loop.run_in_executor(None, self.latency_policy.flush)
+                metrics.update(
+                    total_s=total,
+                    ttft_s=streamed[0] - start if streamed else None,
+                    attempts=attempt + 1,
+                    prompt_tokens=usage.get("prompt_tokens"),
+                    completion_tokens=usage.get("completion_tokens"),
+                    cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+                )
+                return text
+        finally:
+            CURRENT_REQUEST_METRICS.reset(context_token)
+
+    async def lm_studio_chat(self, server_url, payload, on_token=None, usage=None, timeout=15):
+        """
+        Routes the completion to the least-loaded healthy server in the pool that serves
+        the model, failing over to the next one if the connection cannot be made.
+        """
+        self.lmstudio_pool.configure(server_url)
+        return await self.lmstudio_pool.request(
+            payload["model"], lambda base_url: self.lm_studio_chat_at(base_url, payload, on_token, usage, timeout)
+        )
+
+    async def lm_studio_chat_at(self, server_url, payload, on_token=None, usage=None, timeout=15):
+        metrics = CURRENT_REQUEST_METRICS.get()
+        if metrics is not None:
+            metrics["server"] = LMStudioTransport.normalize(server_url)
+        if not on_token:
+            resp = await self.lmstudio_transport.post(server_url, "/v1/chat/completions", json=payload, timeout=timeout)
+            resp.raise_for_status()
+            data = resp.json()
+            if usage is not None and data.get("usage"):
+                usage.update(data["usage"])
+            if "choices" not in data or len(data["choices"]) == 0:
+                return None
+            return data["choices"][0]["message"]["content"]
+
+        # Streaming mode: httpx applies timeout to each read, and chat_completion's
+        # asyncio.wait_for deadline still bounds the whole completion
+        payload = dict(payload, stream=True)
+        if usage is not None:
+            payload["stream_options"] = {"include_usage": True}
+        chunks = []
+        async with self.lmstudio_transport.stream(server_url, "POST", "/v1/chat/completions", json=payload, timeout=timeout) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    # Keep reading to the end of the body so the connection returns to the pool
+                    continue
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping malformed stream chunk: {data[:200]}")
+                    continue
+                if usage is not None and event.get("usage"):
+                    usage.update(event["usage"])
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    chunks.append(token)
+                    on_token(token)
+        return "".join(chunks)
+
+    async def warm_up_lm_studio(self, server_url, model, system_prompt, timeout=MODEL_WARM_UP_TIMEOUT):
+        """
+        Makes every pooled LM Studio server that serves model load it and prefill the
+        system prompt, using a one-token completion. Returns {server_url: seconds}.
+        """
+        self.lmstudio_pool.configure(server_url)
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": "ping"}
+            ],
+            "max_tokens": 1
+        }
+
+        async def warm_up(url):
+            start = time.perf_counter()
+            await self.lm_studio_chat_at(url, payload, timeout=timeout)
+            return url, time.perf_counter() - start
+
+        results = await asyncio.gather(*(warm_up(url) for url in self.lmstudio_pool.candidates(model)), return_exceptions=True)
+        timings = dict(r for r in results if not isinstance(r, BaseException))
+        if not timings:
+            errors = [r for r in results if isinstance(r, BaseException)]
+            raise errors[0] if errors else RuntimeError(f"No LM Studio server is serving model {model}")
+        return timings
+
+    async def openai_chat(self, api_key, payload, on_token=None, usage=None, timeout=None):
+        client = self.openai_clients.get(api_key)
+        if timeout:
+            payload = dict(payload, timeout=timeout)
+        if not on_token:
+            response = await client.chat.completions.create(**payload)
+            if usage is not None and response.usage:
+                usage.update(response.usage.model_dump(exclude_none=True))
+            return response.choices[0].message.content
+
+        if usage is not None:
+            payload = dict(payload, stream_options={"include_usage": True})
+        stream = await client.chat.completions.create(stream=True, **payload)
+        chunks = []
+        try:
+            async for chunk in stream:
+                if usage is not None and chunk.usage:
+                    usage.update(chunk.usage.model_dump(exclude_none=True))
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if token:
+                    chunks.append(token)
+                    on_token(token)
+        finally:
+            # Closes the connection straight away if the request was cancelled mid-stream
+            await stream.close()
+        return "".join(chunks)
@@ -0,0 +1,323 @@
+"""
+UI-independent chat conversations.
+"""
+import asyncio
+import json
+import logging
+import platform
+import time
+
+from .caches import ResponseCache
+from .config import LM_STUDIO_RESPONSE_FORMAT, OPENAI_RESPONSE_FORMAT
+from .context import ContextWindow
+
+class ChatSession:
+    """
+    One conversation, independent of the UI: builds each request (system prompt and
+    replayed history within the model's context budget), sends it through the
+    ProviderEngine, parses the structured response and records the exchange.
+    on_commit is called after an exchange is recorded and on_notice with user-facing
+    messages such as context trimming; both may run on the engine thread.
+    """
+    def __init__(self, engine, is_windows=None, response_cache=None, context_window=None, on_commit=None, on_notice=None):
+        self.engine = engine
+        self.is_windows = platform.system().lower().startswith('win') if is_windows is None else is_windows
+        self.shell_key = "powershell" if self.is_windows else "zsh"
+        self.response_cache = response_cache
+        # Keeps replayed history within each model's context budget
+        self.context_window = context_window or ContextWindow()
+        self.on_commit = on_commit
+        self.on_notice = on_notice
+        # System prompts are built once and reused verbatim for prompt-cache hits
+        self.system_prompts = {"LM Studio": self.lm_studio_system_prompt(), "OpenAI": self.openai_system_prompt()}
+        self.reset()
+
+    @staticmethod
+    def generate_chat_id():
+        """Generate a unique chat ID"""
+        return f"chat_{int(time.time())}"
+
+    def reset(self, chat_id=None):
+        """Start an empty conversation."""
+        self.load(chat_id or self.generate_chat_id(), "New Chat", [])
+
+    def load(self, chat_id, title, history):
+        """Continue a saved conversation."""
+        self.chat_id = chat_id
+        self.title = title
+        self.history = history
+        # Compact assistant turns already encoded for replay, keyed by (chat_id, exchange index)
+        self.compact_turns = {}
+        # First replayed turn per (chat_id, provider, model); it only moves when the budget
+        # overflows, so the replayed prefix stays byte-identical between prompts
+        self.context_starts = {}
+
+    def cache_response(self, cache_key, response):
+        """
+        Writes a response to the response cache on the loop's executor; the reply doesn't
+        wait for the entry and index files to be written.
+        """
+        asyncio.get_running_loop().run_in_executor(None, self.response_cache.put, cache_key, response)
+
+    def commit_exchange(self, user_prompt, response):
+        """
+        Records a completed exchange in the conversation history and notifies on_commit.
+        """
+        # Update chat title if this is the first message
+        if not self.history:
+            self.title = response.get('title', 'New Chat')
+        # Add to conversation history
+        self.history.append({
+            "prompt": user_prompt,
+            "response": response
+        })
+        if self.on_commit:
+            self.on_commit()
+
+    def build_messages(self, provider, model, system_prompt, user_prompt, reserve=0):
+        """
+        Assembles system prompt, replayed history and the new prompt, trimmed to the
+        model's token budget, and reports any dropped turns through on_notice.
+        Past assistant turns are replayed in their compact encoding.
+        """
+        turns = []
+        for i, exchange in enumerate(self.history):
+            turn = [{"role": "user", "content": exchange["prompt"]}]
+            if "response" in exchange:
+                key = (self.chat_id, i)
+                content = self.compact_turns.get(key)
+                if content is None:
+                    content = ContextWindow.compact_response(exchange["response"], self.shell_key)
+                    self.compact_turns[key] = content
+                turn.append({"role": "assistant", "content": content})
+            turns.append(turn)
+
+        start_key = (self.chat_id, provider, model)
+        messages, report = self.context_window.fit(
+            provider,
+            model,
+            {"role": "system", "content": system_prompt},
+            turns,
+            {"role": "user", "content": user_prompt},
+            reserve=reserve,
+            start=self.context_starts.get(start_key, 0)
+        )
+        self.context_starts[start_key] = report["start"]
+        logging.debug(f"Context for {model}: {report}")
+        if report["trimmed_turns"] and self.on_notice:
+            self.on_notice(
+                f"Context: dropped {report['trimmed_turns']} older turn(s) (~{report['dropped_tokens']} tokens in total) "
+                f"to fit the {report['budget']}-token budget for {model}")
+        return messages
+
+    def lm_studio_system_prompt(self):
+        """
+        OS-specific system prompt for LM Studio requests.
+        """
+        if self.is_windows:
+            return (
+                "You are a highly skilled Windows PowerShell expert specializing in system administration, "
+                "automation, and development tasks. Your responses should be tailored for Windows environments "
+                "and utilize PowerShell's advanced features effectively.\n\n"
+                "For every response, output a JSON object with these keys:\n\n"
+                "• \"powershell\": ONLY include the exact PowerShell commands to execute. No comments, no explanations, "
+                "no backticks, no markdown formatting. Multiple commands should be separated by semicolons or newlines. "
+                "If no command is needed, output an empty string (\"\").\n\n"
+                "• \"zsh\": Always output an empty string (\"\") since we're on Windows.\n\n"
+                "• \"instructions\": All other information goes here, including:\n"
+                "  - Command explanations and descriptions\n"
+                "  - Prerequisites or dependencies\n"
+                "  - Expected output or behavior\n"
+                "  - Error handling and troubleshooting\n"
+                "  - Alternative approaches\n"
+                "  - Code examples and documentation\n"
+                "You may use Markdown formatting in this field only.\n\n"
+                "• \"title\": A concise, descriptive title for this chat exchange (max 50 characters).\n\n"
+                "Ensure all PowerShell commands follow security best practices and are safe to execute.\n\n"
+                "IMPORTANT: Never include command explanations or markdown formatting in the powershell field - "
+                "all explanatory text must go in the instructions field."
+            )
+        else:
+            return (
+                "You are a highly skilled Unix/macOS shell expert specializing in ZSH, system administration, "
+                "and development tasks. Your responses should be tailored for Unix/macOS environments "
+                "and leverage ZSH's advanced features effectively.\n\n"
+                "For every response, output a JSON object with these keys:\n\n"
+                "• \"zsh\": ONLY include the exact ZSH commands to execute. No comments, no explanations, "
+                "no backticks, no markdown formatting. Multiple commands should be separated by semicolons or newlines. "
+                "If no command is needed, output an empty string (\"\").\n\n"
+                "• \"powershell\": Always output an empty string (\"\") since we're on Unix/macOS.\n\n"
+                "• \"instructions\": All other information goes here, including:\n"
+                "  - Command explanations and descriptions\n"
+                "  - Prerequisites or dependencies\n"
+                "  - Expected output or behavior\n"
+                "  - Error handling and troubleshooting\n"
+                "  - Alternative approaches\n"
+                "  - Code examples and documentation\n"
+                "You may use Markdown formatting in this field only.\n\n"
+                "• \"title\": A concise, descriptive title for this chat exchange (max 50 characters).\n\n"
+                "Ensure all commands follow security best practices and are safe to execute.\n\n"
+                "IMPORTANT: Never include command explanations or markdown formatting in the zsh field - "
+                "all explanatory text must go in the instructions field."
+            )
+
+    def openai_system_prompt(self):
+        """
+        OS-specific system prompt for OpenAI requests.
+        """
+        if self.is_windows:
+            return """You are a Windows PowerShell automation expert. Follow these rules:
+1. Provide PowerShell commands that are safe and effective
+2. Include detailed explanations of what each command does
+3. Format response as a JSON object with these fields:
+   - powershell: ONLY the exact PowerShell commands (no backticks/comments)
+   - zsh: Empty string for Windows
+   - instructions: Markdown-formatted explanations
+   - title: Short descriptive title (max 50 chars)
+4. Ensure all commands are properly escaped and quoted
+5. Use absolute paths when necessary"""
+        else:
+            return """You are a Unix/macOS shell automation expert. Follow these rules:
+1. Provide ZSH commands that are safe and effective
+2. Include detailed explanations of what each command does
+3. Format response as a JSON object with these fields:
+   - powershell: Empty string for Unix/macOS
+   - zsh: ONLY the exact ZSH commands (no backticks/comments)
+   - instructions: Markdown-formatted explanations
+   - title: Short descriptive title (max 50 chars)
+4. Ensure all commands are properly escaped and quoted
+5. Use absolute paths when necessary"""
+
+    async def send_lm_studio_prompt(self, model, user_prompt, server_url, on_token=None, use_cache=False, usage=None, commit=True, metrics=None):
+        """
+        Sends a chat-style request to LM Studio's /v1/chat/completions (at server_url,
+        which may list several servers).
+        Includes structured output format and OS-specific system prompts.
+        If on_token is given, the completion is streamed and each token is passed to it.
+        With use_cache, repeated prompts are answered from the response cache.
+        usage collects reported token counts; commit=False leaves the conversation untouched.
+        metrics collects request timings (see ProviderEngine.chat_completion) plus parse_s.
+        """
+        system_prompt = self.system_prompts["LM Studio"]
+        cache_key = None
+        if use_cache and self.response_cache is not None:
+            cache_key = ResponseCache.make_key("LM Studio", model, system_prompt, self.history, user_prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                if commit:
+                    self.commit_exchange(user_prompt, cached)
+                return dict(cached, cached=True)
+
+        # Include as much conversation history as fits the model's context budget
+        messages = self.build_messages("LM Studio", model, system_prompt, user_prompt, reserve=1000)
+
+        # Base payload that works for all models
+        payload = {
+            "model": model,
+            "messages": messages,
+            "response_format": LM_STUDIO_RESPONSE_FORMAT,
+            "max_tokens": 1000
+        }
+
+        try:
+            assistant_message = await self.engine.chat_completion(
+                "LM Studio", payload, server_url=server_url, on_token=on_token, usage=usage, metrics=metrics
+            )
+            logging.debug(f"LM Studio servers: {self.engine.lmstudio_pool.status()} pools: {self.engine.lmstudio_transport.stats()}")
+            if not assistant_message:
+                return None
+            assistant_message = assistant_message.strip()
+            # Strip markdown code block markers if present
+            if assistant_message.startswith("```json"):
+                assistant_message = assistant_message.replace("```json", "").rstrip("```").strip()
+            try:
+                parse_start = time.perf_counter()
+                parsed = json.loads(assistant_message)
+                if metrics is not None:
+                    metrics["parse_s"] = time.perf_counter() - parse_start
+                if commit:
+                    self.commit_exchange(user_prompt, parsed)
+                if cache_key:
+                    self.cache_response(cache_key, parsed)
+                return parsed
+            except json.JSONDecodeError:
+                return { self.shell_key: "", "instructions": assistant_message, "error": True }
+        except Exception as e:
+            logging.error(f"LM Studio API error: {e}")
+            return {
+                "powershell": "",
+                "zsh": "",
+                "instructions": f"Error: {str(e)}",
+                "title": "API Error",
+                "error": True
+            }
+
+    async def send_openai_prompt(self, model, user_prompt, api_key, on_token=None, use_cache=False, usage=None, commit=True, metrics=None):
+        """
+        Send a chat-style request to OpenAI's /v1/chat/completions endpoint.
+        Uses OpenAI's structured output format for GPT-4 and newer models.
+        If on_token is given, the completion is streamed and each token is passed to it.
+        With use_cache, repeated prompts are answered from the response cache.
+        usage collects reported token counts; commit=False leaves the conversation untouched.
+        metrics collects request timings (see ProviderEngine.chat_completion) plus parse_s.
+        """
+        system_prompt = self.system_prompts["OpenAI"]
+        cache_key = None
+        if use_cache and self.response_cache is not None:
+            cache_key = ResponseCache.make_key("OpenAI", model, system_prompt, self.history, user_prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                if commit:
+                    self.commit_exchange(user_prompt, cached)
+                return dict(cached, cached=True)
+
+        try:
+            # Include as much conversation history as fits the model's context budget
+            messages = self.build_messages("OpenAI", model, system_prompt, user_prompt, reserve=1000)
+
+            # Create chat completion with function calling
+            payload = {
+                "model": model,
+                "messages": messages,
+                "temperature": 0.7,
+                "response_format": OPENAI_RESPONSE_FORMAT
+            }
+            response_text = await self.engine.chat_completion("OpenAI", payload, api_key=api_key, on_token=on_token, usage=usage, metrics=metrics)
+            
+            # Extract and validate the response
+            parse_start = time.perf_counter()
+            response_data = json.loads(response_text)
+            if metrics is not None:
+                metrics["parse_s"] = time.perf_counter() - parse_start
+            
+            # Validate required fields
+            required_fields = ["powershell", "zsh", "instructions", "title"]
+            for field in required_fields:
+                if field not in response_data:
+                    raise ValueError(f"Missing required field: {field}")
+            
+            if commit:
+                self.commit_exchange(user_prompt, response_data)
+            if cache_key:
+                self.cache_response(cache_key, response_data)
+            
+            return response_data
+            
+        except json.JSONDecodeError as e:
+            logging.error(f"Failed to parse OpenAI response: {e}")
+            return {
+                "powershell": "",
+                "zsh": "",
+                "instructions": "Error: Invalid response format from OpenAI",
+                "title": "Error Processing Response",
+                "error": True
+            }
+        except Exception as e:
+            logging.error(f"OpenAI API error: {e}")
+            return {
+                "powershell": "",
+                "zsh": "",
+                "instructions": f"Error: {str(e)}",
+                "title": "API Error",
+                "error": True
+            }
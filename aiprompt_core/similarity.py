@@ -0,0 +1,131 @@
+"""
+Similar-exchange search over saved chats.
+"""
+import threading
+
+# NumPy is optional; without it the similar-command suggestions are disabled
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class ExchangeIndex:
+    """
+    Character n-gram TF-IDF index over saved prompt -> command exchanges.
+    N-grams are hashed into a fixed number of buckets and stored as NumPy CSR arrays,
+    so adding an exchange costs O(prompt length) and a lookup is one pass over the nonzeros.
+    """
+    NGRAM = 3
+    BUCKETS = 1 << 18
+    COMPACT_MIN_INACTIVE = 256  # removed rows are dropped once there are more of them than this and than live rows
+
+    def __init__(self, shell_key):
+        self.shell_key = shell_key
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries = []           # (chat_id, prompt, response)
+            self.active = []
+            self.row_ids = []           # hashed n-gram buckets per entry
+            self.row_counts = []        # n-gram counts per entry
+            self.inactive = 0           # rows of removed chats still in the lists above
+            self.indexed_counts = {}    # chat_id -> exchanges already indexed
+            self.df = np.zeros(self.BUCKETS, dtype=np.float32)
+            self.dirty = True
+
+    def vectorize(self, text):
+        text = " " + " ".join(text.lower().split()) + " "
+        count = max(len(text) - self.NGRAM + 1, 0)
+        grams = (hash(text[i:i + self.NGRAM]) & (self.BUCKETS - 1) for i in range(count))
+        ids = np.fromiter(grams, dtype=np.int64, count=count)
+        ids, counts = np.unique(ids, return_counts=True)
+        return ids, counts.astype(np.float32)
+
+    def _add(self, chat_id, prompt, response):
+        command = (response or {}).get(self.shell_key, "").strip() if isinstance(response, dict) else ""
+        if not prompt or not command:
+            return
+        ids, counts = self.vectorize(prompt)
+        if not len(ids):
+            return
+        self.entries.append((chat_id, prompt, response))
+        self.active.append(True)
+        self.row_ids.append(ids)
+        self.row_counts.append(counts)
+        self.df[ids] += 1
+        self.dirty = True
+
+    def update_chat(self, chat_id, history):
+        """Index any exchanges of chat_id that were added since the last call."""
+        with self.lock:
+            start = self.indexed_counts.get(chat_id, 0)
+            # A save racing the startup indexing can pass an older, shorter history
+            if len(history) <= start:
+                return
+            for exchange in history[start:]:
+                self._add(chat_id, exchange.get("prompt", ""), exchange.get("response"))
+            self.indexed_counts[chat_id] = len(history)
+
+    def remove_chat(self, chat_id):
+        with self.lock:
+            for i, (entry_chat_id, _, _) in enumerate(self.entries):
+                if entry_chat_id == chat_id and self.active[i]:
+                    self.active[i] = False
+                    self.df[self.row_ids[i]] -= 1
+                    self.inactive += 1
+            self.indexed_counts.pop(chat_id, None)
+            if self.inactive > max(self.COMPACT_MIN_INACTIVE, len(self.entries) - self.inactive):
+                self._compact()
+            self.dirty = True
+
+    def _compact(self):
+        """Drop the rows of removed chats (their document frequencies are already subtracted)."""
+        keep = [i for i, active in enumerate(self.active) if active]
+        self.entries = [self.entries[i] for i in keep]
+        self.row_ids = [self.row_ids[i] for i in keep]
+        self.row_counts = [self.row_counts[i] for i in keep]
+        self.active = [True] * len(keep)
+        self.inactive = 0
+
+    def _rebuild(self):
+        """Recompute IDF weights and row norms after the corpus changed."""
+        active_count = sum(self.active)
+        self.idf = (np.log((1.0 + active_count) / (1.0 + self.df)) + 1.0).astype(np.float32)
+        lengths = np.fromiter((len(ids) for ids in self.row_ids), dtype=np.int64, count=len(self.row_ids))
+        self.indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self.indices = np.concatenate(self.row_ids)
+        self.weights = np.concatenate(self.row_counts) * self.idf[self.indices]
+        self.norms = np.sqrt(np.add.reduceat(self.weights * self.weights, self.indptr[:-1]))
+        self.active_mask = np.array(self.active, dtype=bool)
+        self.dirty = False
+
+    def search(self, query, limit=3):
+        """Return up to limit (score, entry) pairs for the most similar prompts, best first."""
+        with self.lock:
+            if not any(self.active):
+                return []
+            if self.dirty:
+                self._rebuild()
+            ids, counts = self.vectorize(query)
+            if not len(ids):
+                return []
+            query_vector = np.zeros(self.BUCKETS, dtype=np.float32)
+            query_vector[ids] = counts * self.idf[ids]
+            query_norm = np.sqrt(np.dot(query_vector[ids], query_vector[ids]))
+            products = np.add.reduceat(query_vector[self.indices] * self.weights, self.indptr[:-1])
+            scores = products / (self.norms * query_norm)
+            scores[~self.active_mask] = -1.0
+
+            results = []
+            seen_commands = set()
+            for i in np.argsort(-scores):
+                if scores[i] <= 0 or len(results) >= limit:
+                    break
+                command = self.entries[i][2].get(self.shell_key, "").strip()
+                if command in seen_commands:
+                    continue
+                seen_commands.add(command)
+                results.append((float(scores[i]), self.entries[i]))
+            return results
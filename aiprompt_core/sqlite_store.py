@@ -0,0 +1,255 @@
+"""
+Optional SQLite chat store (AIPROMPT_STORE=sqlite), plus import/export to the JSON chat files.
+
+Usage: python -m aiprompt_core.sqlite_store import [--chat-dir DIR]
+       python -m aiprompt_core.sqlite_store export --to DIR [--chat-dir DIR]
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from .config import app_directories
+from .store import ChatStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chats_by_timestamp ON chats (timestamp);
+-- Responses are a few KB, too large for a WITHOUT ROWID table without overflow pages
+CREATE TABLE IF NOT EXISTS exchanges (
+    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT,
+    PRIMARY KEY (chat_id, position)
+);
+CREATE TABLE IF NOT EXISTS terminal_output (
+    chat_id TEXT NOT NULL REFERENCES chats (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (chat_id, position)
+) WITHOUT ROWID;
+"""
+
+class SQLiteChatStore:
+    """
+    Drop-in replacement for ChatStore backed by one SQLite database (chats.sqlite3 in
+    chat_dir) in WAL mode, with tables for chats, exchanges and terminal output.
+
+    Each save is one transaction: the chat row is upserted, exchanges past the stored
+    count are inserted (ChatSession only ever appends to a history) and the terminal
+    output is replaced. Listing reads the timestamp index; bulk deletes are a single
+    DELETE that cascades to the other tables. When the database is first created, the
+    JSON chat files already in chat_dir are imported into it.
+    """
+    DB_FILE = "chats.sqlite3"
+    DELETE_BATCH = 500  # ids per DELETE ... IN (...) statement
+
+    def __init__(self, chat_dir, import_json=True):
+        self.chat_dir = chat_dir
+        self.db_path = os.path.join(chat_dir, self.DB_FILE)
+        self.lock = threading.Lock()
+        os.makedirs(chat_dir, exist_ok=True)
+        created = not os.path.exists(self.db_path)
+        # One connection shared by the Tk and engine threads, serialized by self.lock
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        if created and import_json:
+            imported = self.import_json(chat_dir)
+            if imported:
+                logging.info(f"Imported {imported} JSON chats into {self.db_path}")
+
+    def path(self, chat_id):
+        return f"{self.db_path} (chat {chat_id})"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def save(self, chat_id, title, history, terminal_output):
+        """Write a chat, replacing any earlier save, and return the saved data."""
+        chat_data = {
+            'id': chat_id,
+            'title': title,
+            'timestamp': time.time(),
+            'history': history,
+            'terminal_output': terminal_output
+        }
+        self.write(chat_data)
+        return chat_data
+
+    def write(self, chat_data):
+        """Write a chat's saved data as is (keeping its timestamp)."""
+        with self.lock, self.conn:
+            self.write_chat(chat_data)
+
+    def write_chat(self, chat_data, replace_history=False):
+        """
+        Upsert one chat inside the caller's transaction. Unless replace_history is set, stored
+        exchanges are assumed unchanged and only the ones past them are written.
+        """
+        chat_id = chat_data['id']
+        history = chat_data.get('history') or []
+        output = chat_data.get('terminal_output') or []
+        self.conn.execute(
+            "INSERT INTO chats (id, title, timestamp) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET title = excluded.title, timestamp = excluded.timestamp",
+            (chat_id, chat_data['title'], chat_data['timestamp'])
+        )
+        stored = self.conn.execute("SELECT COUNT(*) FROM exchanges WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+        if replace_history:
+            stored = 0
+            self.conn.execute("DELETE FROM exchanges WHERE chat_id = ?", (chat_id,))
+        elif stored > len(history):
+            self.conn.execute("DELETE FROM exchanges WHERE chat_id = ? AND position >= ?", (chat_id, len(history)))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO exchanges (chat_id, position, prompt, response) VALUES (?, ?, ?, ?)",
+            [(chat_id, i, exchange.get('prompt', ""),
+              json.dumps(exchange['response'], ensure_ascii=False) if 'response' in exchange else None)
+             for i, exchange in enumerate(history[stored:], start=stored)]
+        )
+        self.conn.execute("DELETE FROM terminal_output WHERE chat_id = ?", (chat_id,))
+        self.conn.executemany(
+            "INSERT INTO terminal_output (chat_id, position, line) VALUES (?, ?, ?)",
+            [(chat_id, i, str(line)) for i, line in enumerate(output)]
+        )
+
+    def load(self, chat_id):
+        """Returns the saved data of a chat, or None if it does not exist."""
+        with self.lock:
+            row = self.conn.execute("SELECT id, title, timestamp FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            exchanges = self.conn.execute(
+                "SELECT prompt, response FROM exchanges WHERE chat_id = ? ORDER BY position", (chat_id,)
+            ).fetchall()
+            output = self.conn.execute(
+                "SELECT line FROM terminal_output WHERE chat_id = ? ORDER BY position", (chat_id,)
+            ).fetchall()
+        history = []
+        for prompt, response in exchanges:
+            exchange = {"prompt": prompt}
+            if response is not None:
+                exchange["response"] = json.loads(response)
+            history.append(exchange)
+        return {
+            'id': row[0],
+            'title': row[1],
+            'timestamp': row[2],
+            'history': history,
+            'terminal_output': [line for (line,) in output]
+        }
+
+    def iter_chats(self):
+        """Yields the saved data of every chat, newest first."""
+        for _, _, chat_id in self.list_chats():
+            chat_data = self.load(chat_id)
+            if chat_data is not None:
+                yield chat_data
+
+    def list_chats(self):
+        """Returns (timestamp, title, chat_id) for every saved chat, newest first."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT timestamp, title, id FROM chats ORDER BY timestamp DESC, title DESC, id DESC"
+            ).fetchall()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def delete(self, chat_id):
+        """Delete one chat. Returns False if it did not exist."""
+        return self.delete_many([chat_id]) == 1
+
+    def delete_many(self, chat_ids):
+        """Delete several chats in one transaction and return how many existed."""
+        chat_ids = list(chat_ids)
+        deleted = 0
+        with self.lock, self.conn:
+            for start in range(0, len(chat_ids), self.DELETE_BATCH):
+                batch = chat_ids[start:start + self.DELETE_BATCH]
+                deleted += self.conn.execute(
+                    f"DELETE FROM chats WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).rowcount
+        logging.info(f"Deleted {deleted} chats from {self.db_path}")
+        return deleted
+
+    def clear(self):
+        """Delete every saved chat and return how many were removed."""
+        with self.lock:
+            # With foreign keys off SQLite truncates each table instead of deleting (and
+            # cascading) row by row; the child tables are emptied explicitly instead
+            self.conn.execute("PRAGMA foreign_keys=OFF")
+            try:
+                with self.conn:
+                    self.conn.execute("DELETE FROM terminal_output")
+                    self.conn.execute("DELETE FROM exchanges")
+                    deleted = self.conn.execute("DELETE FROM chats").rowcount
+            finally:
+                self.conn.execute("PRAGMA foreign_keys=ON")
+        logging.info(f"Deleted {deleted} chats from {self.db_path}")
+        return deleted
+
+    # ---------------------- JSON Import / Export ----------------------
+    def import_json(self, json_dir):
+        """Copy every JSON chat file in json_dir into the database (one transaction). Returns the count."""
+        imported = 0
+        with self.lock, self.conn:
+            for chat_data in ChatStore(json_dir).iter_chats():
+                try:
+                    self.write_chat(chat_data, replace_history=True)
+                    imported += 1
+                except (KeyError, TypeError, AttributeError) as e:
+                    logging.error(f"Skipping chat {chat_data.get('id') if isinstance(chat_data, dict) else '?'} on import: {e}")
+        return imported
+
+    def export_json(self, json_dir):
+        """Write every chat in the database to json_dir as JSON chat files. Returns the count."""
+        json_store = ChatStore(json_dir)
+        exported = 0
+        for chat_data in self.iter_chats():
+            json_store.write(chat_data)
+            exported += 1
+        return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m aiprompt_core.sqlite_store",
+                                     description="Copy chats between the JSON chat files and the SQLite chat store.")
+    parser.add_argument("action", choices=["import", "export"],
+                        help="import: JSON files in --chat-dir into the database; export: database into --to")
+    parser.add_argument("--chat-dir", default=app_directories()[1], help="chat directory (default: the app's)")
+    parser.add_argument("--to", metavar="DIR", help="directory to export JSON chat files to")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    store = SQLiteChatStore(args.chat_dir, import_json=False)
+    try:
+        if args.action == "import":
+            count = store.import_json(args.chat_dir)
+            print(f"Imported {count} chats into {store.db_path} in {time.perf_counter() - started:.1f}s")
+        else:
+            if not args.to:
+                parser.error("export needs --to DIR")
+            count = store.export_json(args.to)
+            print(f"Exported {count} chats to {args.to} in {time.perf_counter() - started:.1f}s")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,467 @@
+"""
+Saved chats, one JSON snapshot plus an append-only journal per chat, and an index of
+their titles and timestamps.
+"""
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+class ChatStore:
+    """
+    Reads and writes saved chats as <chat_id>.json files in chat_dir. Each file holds
+    the chat's id, title, last-saved timestamp, exchange history and terminal output.
+
+    Saving a chat the store already knows about doesn't rewrite that file: the new
+    exchanges and output lines are appended to <chat_id>.journal as JSON lines, e.g.
+
+      {"type":"journal","snapshot_id":...}        first line, ties the journal to its snapshot
+      {"type":"history","position":4,"exchanges":[...]}
+      {"type":"output","position":120,"lines":[...]}
+      {"type":"chat","title":...,"timestamp":...}
+
+    Loading replays the journal over the snapshot; a "position" below the current length
+    replaces everything from there on, which covers cleared output. A torn last line
+    (crash mid-append) and corrupt lines are skipped. Once a journal outgrows its
+    snapshot (or COMPACT_MIN_BYTES) a background thread folds it into a new snapshot,
+    so loading a chat never reads much more than twice its size. Snapshots are replaced
+    atomically and carry a new snapshot_id, so a journal left behind by a crash
+    mid-compaction no longer matches and is ignored.
+
+    The chat list is served from .chat_index.jsonl, an append-only log of small
+    {id, title, timestamp, mtime_ns, size} records (or {id, deleted} tombstones) that
+    save and delete append to; the last record per id wins. Listing stats the chat
+    files and re-reads only those whose mtime or size no longer match their record,
+    so the index heals itself after crashes, torn lines or edits made outside the app,
+    and a missing index is rebuilt from the chat files.
+    """
+    INDEX_FILE = ".chat_index.jsonl"
+    JOURNAL_EXT = ".journal"
+    COMPACT_MIN_BYTES = 64 * 1024  # journals smaller than this are never compacted
+
+    def __init__(self, chat_dir):
+        self.chat_dir = chat_dir
+        self.index_path = os.path.join(chat_dir, self.INDEX_FILE)
+        self.lock = threading.Lock()
+        self.entries = None  # chat_id -> {title, timestamp, mtime_ns, size, journal_size}; loaded on first use
+        self.index_records = 0  # records in the index file, including superseded ones
+        self.index_torn = False  # the index file ends in a partial line
+        # Chat files are written under journal_lock; self.lock only guards the index
+        self.journal_lock = threading.Lock()
+        self.journals = {}  # chat_id -> what is on disk for chats saved or loaded in this process
+        self.compact_queue = queue.Queue()
+        self.compact_pending = set()
+        self.compactor = None
+
+    def path(self, chat_id):
+        return os.path.join(self.chat_dir, f"{chat_id}.json")
+
+    def journal_path(self, chat_id):
+        return os.path.join(self.chat_dir, f"{chat_id}{self.JOURNAL_EXT}")
+
+    def chat_files(self):
+        return glob.glob(os.path.join(self.chat_dir, "*.json"))
+
+    def save(self, chat_id, title, history, terminal_output):
+        """Write a chat, replacing any earlier save, and return the saved data."""
+        chat_data = {
+            'id': chat_id,
+            'title': title,
+            'timestamp': time.time(),
+            'history': history,
+            'terminal_output': terminal_output
+        }
+        with self.journal_lock:
+            state = self.journals.get(chat_id)
+            if state is None and os.path.exists(self.path(chat_id)):
+                try:
+                    state = self.read_chat(chat_id)[1]
+                except Exception as e:
+                    logging.error(f"Failed to read chat file {self.path(chat_id)}, rewriting it: {str(e)}")
+            if state is None:
+                self.write_snapshot(chat_data)
+            else:
+                self.append_journal(chat_data, state)
+        return chat_data
+
+    def write(self, chat_data):
+        """Write a chat's saved data as is (keeping its timestamp), e.g. when copying between stores."""
+        with self.journal_lock:
+            self.write_snapshot(chat_data)
+
+    def load(self, chat_id):
+        """Returns the saved data of a chat, or None if it does not exist."""
+        with self.journal_lock:
+            chat_data, state = self.read_chat(chat_id)
+            if state is not None:
+                # The chat is likely to be continued; its next save can then append
+                self.journals[chat_id] = state
+        return chat_data
+
+    def iter_chats(self):
+        """Yields the saved data of every readable chat, in no particular order."""
+        for file in self.chat_files():
+            try:
+                chat_data = self.read_chat(os.path.basename(file)[:-len(".json")])[0]
+            except Exception as e:
+                logging.error(f"Failed to read chat file {file}: {str(e)}")
+                continue
+            if chat_data is not None:
+                yield chat_data
+
+    def list_chats(self):
+        """Returns (timestamp, title, chat_id) for every saved chat, newest first."""
+        with self.lock:
+            entries = self.load_index()
+            records = []
+            snapshots = {}
+            journal_sizes = {}
+            try:
+                scan = os.scandir(self.chat_dir)
+            except FileNotFoundError:
+                scan = None
+            if scan is not None:
+                with scan:
+                    for file in scan:
+                        chat_id, ext = os.path.splitext(file.name)
+                        if file.name.startswith(".") or ext not in (".json", self.JOURNAL_EXT):
+                            continue
+                        try:
+                            stat = file.stat()
+                        except OSError:
+                            continue
+                        if ext == ".json":
+                            snapshots[chat_id] = (file.path, stat)
+                        else:
+                            journal_sizes[chat_id] = stat.st_size
+            for chat_id, (chat_file, stat) in snapshots.items():
+                journal_size = journal_sizes.get(chat_id, 0)
+                entry = entries.get(chat_id)
+                if (entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+                        and entry.get("journal_size", 0) == journal_size):
+                    continue
+                # New, or changed outside the index: re-read just this chat
+                try:
+                    entry = self.index_entry(self.read_chat(chat_id)[0], stat, journal_size)
+                except Exception as e:
+                    logging.error(f"Failed to read chat file {chat_file}: {str(e)}")
+                    if entries.pop(chat_id, None) is not None:
+                        records.append({"id": chat_id, "deleted": True})
+                    continue
+                entries[chat_id] = entry
+                records.append(dict(entry, id=chat_id))
+            for chat_id in [chat_id for chat_id in entries if chat_id not in snapshots]:
+                del entries[chat_id]
+                records.append({"id": chat_id, "deleted": True})
+            if records:
+                self.append_index(records)
+            chats = [(entry["timestamp"], entry["title"], chat_id) for chat_id, entry in entries.items()]
+        chats.sort(reverse=True)
+        return chats
+
+    def count(self):
+        return len(self.chat_files())
+
+    def delete(self, chat_id):
+        """Delete one chat. Returns False if it did not exist."""
+        return self.delete_many([chat_id]) == 1
+
+    def delete_many(self, chat_ids):
+        """Delete several chats and return how many existed. Raises if a chat file can't be removed."""
+        deleted = []
+        try:
+            with self.journal_lock:
+                for chat_id in chat_ids:
+                    chat_file = self.path(chat_id)
+                    self.journals.pop(chat_id, None)
+                    if not os.path.exists(chat_file):
+                        continue
+                    # Journal first, so a crash can't leave one behind to be replayed onto a new chat
+                    self.remove_journal(chat_id)
+                    os.remove(chat_file)
+                    deleted.append(chat_id)
+                    logging.info(f"Deleted chat file: {chat_file}")
+        finally:
+            with self.lock:
+                entries = self.load_index()
+                records = [{"id": chat_id, "deleted": True} for chat_id in deleted if entries.pop(chat_id, None) is not None]
+                if records:
+                    self.append_index(records)
+        return len(deleted)
+
+    def clear(self):
+        """Delete every saved chat and return how many were removed."""
+        deleted = 0
+        with self.journal_lock:
+            self.journals.clear()
+            for file in glob.glob(os.path.join(self.chat_dir, f"*{self.JOURNAL_EXT}")):
+                try:
+                    os.remove(file)
+                except Exception as e:
+                    logging.error(f"Failed to delete file {file}: {str(e)}")
+            for file in self.chat_files():
+                try:
+                    os.remove(file)
+                    deleted += 1
+                    logging.info(f"Deleted chat file: {file}")
+                except Exception as e:
+                    logging.error(f"Failed to delete file {file}: {str(e)}")
+        with self.lock:
+            # Anything that could not be deleted is picked up again by the next listing
+            self.entries = {}
+            self.write_index()
+        return deleted
+
+    # ---------------------- Snapshots and Journals ----------------------
+    def read_chat(self, chat_id):
+        """
+        Returns (chat_data, state): the snapshot with its journal replayed, and what
+        append_journal needs to know about the files. (None, None) if the chat doesn't exist.
+        """
+        try:
+            with open(self.path(chat_id), 'r') as f:
+                chat_data = json.load(f)
+                snapshot_size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None, None
+        snapshot_id = chat_data.pop('snapshot_id', None)
+        journal_size = 0
+        torn = False
+        try:
+            with open(self.journal_path(chat_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        lines = data.split(b"\n")
+        tail = lines.pop()  # empty unless the last append was cut short
+        try:
+            header = json.loads(lines[0]) if lines else None
+        except ValueError:
+            header = None
+        if isinstance(header, dict) and header.get("type") == "journal" and header.get("snapshot_id") == snapshot_id:
+            journal_size = len(data) - len(tail)
+            torn = bool(tail)
+            for line in lines[1:]:
+                try:
+                    self.apply_journal_record(chat_data, json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # Corrupt line; skip it rather than lose the rest of the chat
+                    continue
+        state = self.journal_state(chat_data, snapshot_id, snapshot_size, journal_size)
+        state["torn"] = torn
+        return chat_data, state
+
+    @staticmethod
+    def apply_journal_record(chat_data, record):
+        kind = record["type"]
+        if kind == "chat":
+            chat_data['title'] = record["title"]
+            chat_data['timestamp'] = record["timestamp"]
+        elif kind in ("history", "output"):
+            key, items = ('history', record["exchanges"]) if kind == "history" else ('terminal_output', record["lines"])
+            position = record["position"]
+            current = chat_data.get(key) or []
+            if not isinstance(items, list) or not 0 <= position <= len(current):
+                raise ValueError(f"bad {kind} record at position {position}")
+            chat_data[key] = current[:position] + items
+
+    @staticmethod
+    def journal_state(chat_data, snapshot_id, snapshot_size, journal_size):
+        history = chat_data.get('history') or []
+        output = chat_data.get('terminal_output') or []
+        return {
+            "snapshot_id": snapshot_id,
+            "snapshot_size": snapshot_size,
+            "journal_size": journal_size,
+            "torn": False,
+            # Shallow copies of what is on disk; exchanges must not be changed in place after saving
+            "history": list(history),
+            "output": list(output)
+        }
+
+    @staticmethod
+    def unchanged_prefix(items, stored):
+        """
+        How many of the stored items are still, unchanged, at the start of items: all of them
+        if items starts with the whole stored list, otherwise none. The whole prefix is
+        compared because the app replaces terminal output wholesale, and runs of the same
+        command end in the same lines. Unchanged exchanges are the same objects, so this is
+        mostly identity checks.
+        """
+        if len(stored) <= len(items) and items[:len(stored)] == stored:
+            return len(stored)
+        return 0
+
+    def append_journal(self, chat_data, state):
+        """Append what changed since the last save to the chat's journal. Call with self.journal_lock held."""
+        chat_id = chat_data['id']
+        history = chat_data['history'] or []
+        output = chat_data['terminal_output'] or []
+        records = []
+        if not state["journal_size"]:
+            records.append({"type": "journal", "snapshot_id": state["snapshot_id"]})
+        start = self.unchanged_prefix(history, state["history"])
+        if start < len(history) or start < len(state["history"]):
+            records.append({"type": "history", "position": start, "exchanges": history[start:]})
+        start = self.unchanged_prefix(output, state["output"])
+        if start < len(output) or start < len(state["output"]):
+            records.append({"type": "output", "position": start, "lines": output[start:]})
+        records.append({"type": "chat", "title": chat_data['title'], "timestamp": chat_data['timestamp']})
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode('utf-8')
+
+        journal_file = self.journal_path(chat_id)
+        if state["torn"]:
+            # Drop the partial record a crash left, so the next one starts on its own line
+            os.truncate(journal_file, state["journal_size"])
+        with open(journal_file, 'ab' if state["journal_size"] else 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        journal_size = state["journal_size"] + len(data)
+        self.journals[chat_id] = self.journal_state(chat_data, state["snapshot_id"], state["snapshot_size"], journal_size)
+        self.update_index(chat_data, os.stat(self.path(chat_id)), journal_size)
+        if journal_size > max(self.COMPACT_MIN_BYTES, state["snapshot_size"]):
+            self.schedule_compaction(chat_id)
+
+    def write_snapshot(self, chat_data):
+        """Replace a chat's snapshot (atomically) and drop its journal. Call with self.journal_lock held."""
+        chat_id = chat_data['id']
+        # Create chats directory if it doesn't exist
+        os.makedirs(self.chat_dir, exist_ok=True)
+        chat_file = self.path(chat_id)
+        tmp_path = chat_file + ".tmp"
+        snapshot_id = time.time_ns()
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(chat_data, snapshot_id=snapshot_id), f, indent=2)
+            # On disk before it replaces the old snapshot, so a crash leaves one or the other
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, chat_file)
+        self.remove_journal(chat_id)
+        stat = os.stat(chat_file)
+        self.journals[chat_id] = self.journal_state(chat_data, snapshot_id, stat.st_size, 0)
+        self.update_index(chat_data, stat, 0)
+
+    def remove_journal(self, chat_id):
+        try:
+            os.remove(self.journal_path(chat_id))
+        except FileNotFoundError:
+            pass
+
+    def schedule_compaction(self, chat_id):
+        """Queue a chat for the background compactor. Call with self.journal_lock held."""
+        if chat_id in self.compact_pending:
+            return
+        self.compact_pending.add(chat_id)
+        if self.compactor is None:
+            self.compactor = threading.Thread(target=self.compact_worker, name="ChatStoreCompactor", daemon=True)
+            self.compactor.start()
+        self.compact_queue.put(chat_id)
+
+    def compact_worker(self):
+        while True:
+            chat_id = self.compact_queue.get()
+            try:
+                self.compact(chat_id)
+            except Exception as e:
+                logging.error(f"Failed to compact chat {chat_id}: {str(e)}")
+
+    def compact(self, chat_id):
+        """Fold a chat's journal into a new snapshot."""
+        with self.journal_lock:
+            self.compact_pending.discard(chat_id)
+            chat_data = self.read_chat(chat_id)[0]
+            if chat_data is not None:
+                self.write_snapshot(chat_data)
+                logging.info(f"Compacted chat file: {self.path(chat_id)}")
+
+    # ---------------------- Chat Index ----------------------
+    @staticmethod
+    def index_entry(chat_data, stat, journal_size=0):
+        return {
+            "title": chat_data['title'],
+            "timestamp": chat_data['timestamp'],
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "journal_size": journal_size
+        }
+
+    def update_index(self, chat_data, stat, journal_size):
+        with self.lock:
+            entry = self.index_entry(chat_data, stat, journal_size)
+            self.load_index()[chat_data['id']] = entry
+            self.append_index([dict(entry, id=chat_data['id'])])
+
+    def load_index(self):
+        """Returns the in-memory index, reading the index file on first use. Call with self.lock held."""
+        if self.entries is not None:
+            return self.entries
+        self.entries = {}
+        self.index_records = 0
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.index_torn = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                        chat_id = record.pop("id")
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        # Torn or corrupt line; listing re-reads any chat it leaves out of date
+                        continue
+                    self.index_records += 1
+                    if record.get("deleted"):
+                        self.entries.pop(chat_id, None)
+                    elif all(key in record for key in ("title", "timestamp", "mtime_ns", "size")):
+                        self.entries[chat_id] = record
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Failed to read chat index {self.index_path}: {e}")
+        return self.entries
+
+    def append_index(self, records):
+        """Append records to the index file, compacting it once it is mostly superseded records."""
+        self.index_records += len(records)
+        if self.index_records > 2 * len(self.entries) + 1000:
+            self.write_index()
+            return
+        try:
+            os.makedirs(self.chat_dir, exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                if self.index_torn:
+                    # Don't glue the first record onto the partial line left by a crash
+                    f.write("\n")
+                    self.index_torn = False
+                f.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+        except Exception as e:
+            logging.error(f"Failed to update chat index {self.index_path}: {e}")
+
+    def write_index(self):
+        """Rewrite the index file with one record per chat (atomically, via a temp file)."""
+        tmp_path = self.index_path + ".tmp"
+        try:
+            os.makedirs(self.chat_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for chat_id, entry in self.entries.items():
+                    f.write(json.dumps(dict(entry, id=chat_id), separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.index_path)
+            self.index_records = len(self.entries)
+            self.index_torn = False
+        except Exception as e:
+            logging.error(f"Failed to write chat index {self.index_path}: {e}")
+
+def open_chat_store(chat_dir, backend=None):
+    """
+    Returns the chat store for chat_dir selected by backend or the AIPROMPT_STORE
+    environment variable: 'json' (one file per chat, the default) or 'sqlite'.
+    """
+    backend = (backend or os.environ.get("AIPROMPT_STORE") or "json").strip().lower()
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteChatStore
+        return SQLiteChatStore(chat_dir)
+    if backend != "json":
+        logging.warning(f"Unknown chat store {backend!r}, using JSON files")
+    return ChatStore(chat_dir)
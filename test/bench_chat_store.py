@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chat store operations at 10k-100k saved chats.
+
+Generates a synthetic chat directory per size (chats x exchanges per chat x terminal
+output lines) and times the store calls behind each LMStudioApp action:
+
+  list           update_chat_list      (ChatStore.list_chats)
+  list (cold)    first update_chat_list after startup (a new ChatStore on the same directory)
+  load           load_chat             (ChatStore.load of a random chat)
+  save           save_current_chat     (ChatStore.save of a chat that gained an exchange)
+  save+list      one prompt: save_current_chat followed by update_chat_list
+  delete         delete_selected_chats (ChatStore.delete of the selection, count, list)
+  clear          clear_all_chats       (ChatStore.clear)
+
+The OS page cache is left warm, so the numbers are CPU/syscall cost rather than cold
+disk reads. Results are printed and, with --json, appended to a JSON file so runs can
+be compared across store changes. --store picks the backend (json files or sqlite).
+
+Usage: python test/bench_chat_store.py [--chats 10000 100000] [--exchanges 5]
+       [--output-lines 50] [--samples 200] [--store json|sqlite] [--json results.json] [--dir /tmp/chats]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiprompt_core.store import open_chat_store  # noqa: E402
+
+WORDS = ("list files process port network disk usage folder memory docker container git branch "
+         "log search replace archive permission user service restart").split()
+
+
+def make_store(directory, backend):
+    return open_chat_store(directory, backend)
+
+
+def synthetic_exchange(rng):
+    return {
+        "prompt": " ".join(rng.choices(WORDS, k=10)),
+        "response": {
+            "powershell": "",
+            "zsh": " | ".join(rng.choices(["ls -la", "grep foo", "sort -u", "du -sh *", "lsof -i"], k=3)),
+            "instructions": "## Explanation\n\n" + " ".join(rng.choices(WORDS, k=120)),
+            "title": " ".join(rng.choices(WORDS, k=4)).title(),
+        },
+    }
+
+
+def synthetic_chat(rng, index, exchanges, output_lines):
+    history = [synthetic_exchange(rng) for _ in range(exchanges)]
+    output = [" ".join(rng.choices(WORDS, k=12)) for _ in range(output_lines)]
+    return f"chat_{index:07d}", history[0]["response"]["title"] if history else "New Chat", history, output
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def summarize(seconds):
+    ms = sorted(s * 1000 for s in seconds)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.mean(ms), 3),
+        "p50_ms": round(ms[len(ms) // 2], 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def dir_size(directory):
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def run_size(base_dir, chats, args, rng):
+    directory = os.path.join(base_dir, f"chats_{chats}")
+    shutil.rmtree(directory, ignore_errors=True)
+    store = make_store(directory, args.store)
+
+    start = time.perf_counter()
+    ids = []
+    for i in range(chats):
+        chat_id, title, history, output = synthetic_chat(rng, i, args.exchanges, args.output_lines)
+        store.save(chat_id, title, history, output)
+        ids.append(chat_id)
+    generate_s = time.perf_counter() - start
+    results = {
+        "chats": chats,
+        "exchanges": args.exchanges,
+        "output_lines": args.output_lines,
+        "bytes_on_disk": dir_size(directory),
+        "generate_s": round(generate_s, 2),
+    }
+    print(f"{chats} chats generated in {generate_s:.1f}s ({results['bytes_on_disk'] / 1e6:.1f} MB)", file=sys.stderr)
+
+    results["list"] = summarize([timed(store.list_chats)[0] for _ in range(args.list_repeats)])
+    results["list_cold"] = summarize([timed(make_store(directory, args.store).list_chats)[0] for _ in range(args.list_repeats)])
+
+    sample = rng.sample(ids, min(args.samples, len(ids)))
+    results["load"] = summarize([timed(store.load, chat_id)[0] for chat_id in sample])
+
+    saves, cycles = [], []
+    for chat_id in sample[:max(1, args.list_repeats)]:
+        chat = store.load(chat_id)
+        history = chat["history"] + [synthetic_exchange(rng)]
+        seconds, _ = timed(store.save, chat_id, chat["title"], history, chat["terminal_output"])
+        listing, _ = timed(store.list_chats)
+        cycles.append(seconds + listing)
+    for chat_id in sample:
+        chat = store.load(chat_id)
+        history = chat["history"] + [synthetic_exchange(rng)]
+        saves.append(timed(store.save, chat_id, chat["title"], history, chat["terminal_output"])[0])
+    results["save"] = summarize(saves)
+    results["save+list"] = summarize(cycles)
+
+    # Delete a selection of ten chats the way delete_selected_chats does
+    deletes = []
+    for batch in range(args.list_repeats):
+        selection = ids[batch * 10:(batch + 1) * 10]
+        start = time.perf_counter()
+        store.delete_many(selection)
+        if store.count():
+            store.list_chats()
+        deletes.append(time.perf_counter() - start)
+    results["delete"] = summarize(deletes)
+
+    seconds, deleted = timed(store.clear)
+    results["clear"] = {"n": 1, "mean_ms": round(seconds * 1000, 3), "deleted": deleted}
+    shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--exchanges", type=int, default=5, help="exchanges per chat")
+    parser.add_argument("--output-lines", type=int, default=50, help="terminal output lines per chat")
+    parser.add_argument("--samples", type=int, default=200, help="random chats to load and save")
+    parser.add_argument("--list-repeats", type=int, default=5, help="timed list/save+list/delete rounds")
+    parser.add_argument("--store", choices=["json", "sqlite"], default="json", help="chat store backend")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="where to generate chats (default: a temp directory)")
+    parser.add_argument("--json", metavar="FILE", help="append the results to FILE")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_dir = args.dir or tempfile.mkdtemp(prefix="aiprompt-bench-")
+    try:
+        sizes = [run_size(base_dir, chats, args, rng) for chats in args.chats]
+    finally:
+        if not args.dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    print(f"{'chats':>7} {'MB':>7} {'list ms':>9} {'cold list ms':>13} {'load ms':>8} {'save ms':>8} {'save+list ms':>13} "
+          f"{'delete ms':>10} {'clear ms':>9}")
+    for r in sizes:
+        print(f"{r['chats']:>7} {r['bytes_on_disk'] / 1e6:>7.1f} {r['list']['p50_ms']:>9.1f} {r['list_cold']['p50_ms']:>13.1f} {r['load']['p50_ms']:>8.3f} "
+              f"{r['save']['p50_ms']:>8.3f} {r['save+list']['p50_ms']:>13.1f} {r['delete']['p50_ms']:>10.1f} "
+              f"{r['clear']['mean_ms']:>9.1f}")
+
+    if args.json:
+        runs = []
+        if os.path.exists(args.json):
+            with open(args.json) as f:
+                runs = json.load(f)
+        runs.append({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "store": args.store,
+            "sizes": sizes,
+        })
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+        print(f"Results appended to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
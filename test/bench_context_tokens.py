@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt token counts for long chats when past assistant turns are replayed
+as full json.dumps(response) versus the compact encoding used by build_messages.
+
+Token counts use tiktoken when it is installed and the ContextWindow estimate otherwise.
+
+Usage: python test/bench_context_tokens.py [--turns 10 25 50 100] [--instructions-chars 1500]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiprompt_core.context import ContextWindow  # noqa: E402
+
+try:
+    import tiktoken
+    ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    ENCODING = None
+
+WORDS = ("list files process port network disk usage folder memory docker container git branch "
+         "log search replace archive permission user service restart").split()
+
+
+def synthetic_exchange(rng, instructions_chars):
+    words = []
+    while sum(len(w) + 1 for w in words) < instructions_chars:
+        words.append(rng.choice(WORDS))
+    instructions = "## Explanation\n\n" + " ".join(words)
+    return {
+        "prompt": " ".join(rng.choices(WORDS, k=8)),
+        "response": {
+            "powershell": "",
+            "zsh": " | ".join(rng.choices(["ls -la", "grep foo", "sort -u", "du -sh *", "lsof -i"], k=3)),
+            "instructions": instructions,
+            "title": " ".join(rng.choices(WORDS, k=4)).title(),
+        },
+    }
+
+
+def count_tokens(messages):
+    if ENCODING is None:
+        return sum(ContextWindow.estimate_tokens(m) for m in messages)
+    return sum(len(ENCODING.encode(m["content"])) + ContextWindow.MESSAGE_OVERHEAD for m in messages)
+
+
+def build(history, encode):
+    messages = [{"role": "system", "content": "system prompt " * 100}]
+    for exchange in history:
+        messages.append({"role": "user", "content": exchange["prompt"]})
+        messages.append({"role": "assistant", "content": encode(exchange["response"])})
+    messages.append({"role": "user", "content": "next prompt"})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--instructions-chars", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"Token counter: {'tiktoken cl100k_base' if ENCODING else 'ContextWindow estimate'}")
+    print(f"{'turns':>6} {'full tokens':>12} {'compact tokens':>15} {'saved':>7} {'encode full ms':>15} {'encode compact ms':>18}")
+    for turns in args.turns:
+        history = [synthetic_exchange(rng, args.instructions_chars) for _ in range(turns)]
+
+        start = time.perf_counter()
+        full = build(history, json.dumps)
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        compact = build(history, lambda r: ContextWindow.compact_response(r, "zsh"))
+        compact_ms = (time.perf_counter() - start) * 1000
+
+        full_tokens = count_tokens(full)
+        compact_tokens = count_tokens(compact)
+        saved = 1 - compact_tokens / full_tokens
+        print(f"{turns:>6} {full_tokens:>12} {compact_tokens:>15} {saved:>6.0%} {full_ms:>15.2f} {compact_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
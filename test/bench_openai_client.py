@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-call overhead of building an OpenAI client for every prompt
+versus reusing one from OpenAIClientCache.
+
+A tiny local server stands in for the OpenAI API so the numbers only reflect
+client construction and connection setup, not model latency.
+
+Usage: python test/bench_openai_client.py [--calls 200]
+"""
+
+import argparse
+import http.server
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiprompt_core.providers import ProviderEngine, http2_available  # noqa: E402
+import openai  # noqa: E402
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench-model",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": json.dumps({
+            "powershell": "", "zsh": "ls -la", "instructions": "List files.", "title": "List files"
+        })}
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+}).encode()
+
+
+class CompletionHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment so keep-alive calls don't hit delayed-ACK stalls
+    disable_nagle_algorithm = True
+    wbufsize = 65536
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run_calls(get_client, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = get_client()
+        await client.chat.completions.create(model="bench-model", messages=[{"role": "user", "content": "ls"}])
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"{label:<24} mean {statistics.mean(ms):7.3f} ms   p50 {statistics.median(ms):7.3f} ms   "
+          f"p95 {sorted(ms)[int(len(ms) * 0.95) - 1]:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="requests per scenario")
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    engine = ProviderEngine()
+
+    # Construction cost alone, with no request
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        openai.AsyncOpenAI(api_key="sk-bench", base_url=base_url)
+    construct_ms = (time.perf_counter() - start) * 1000 / args.calls
+
+    def new_client():
+        return openai.AsyncOpenAI(api_key="sk-bench", base_url=base_url)
+
+    cache = engine.openai_clients
+
+    def cached_client():
+        return cache.get("sk-bench", base_url)
+
+    print(f"HTTP/2 available: {http2_available()}")
+    print(f"Client construction only: {construct_ms:.3f} ms per client")
+    before = engine.run(run_calls(new_client, args.calls))
+    after = engine.run(run_calls(cached_client, args.calls))
+    report("new client per call", before)
+    report("cached client", after)
+    saved = statistics.mean(before) - statistics.mean(after)
+    print(f"Overhead saved per call: {saved * 1000:.3f} ms")
+
+    engine.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
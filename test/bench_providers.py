@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the provider request path (ChatSession.send_lm_studio_prompt / send_openai_prompt
+through ProviderEngine) against the local mock server, with and without streaming.
+
+For each scenario it reports:
+  - sequential latency per call (mean / p50 / p95) and the client-side overhead, i.e.
+    latency minus the delay the mock server was told to simulate,
+  - throughput with --concurrency requests in flight,
+  - JSON parse cost of the reply, and the incremental stream parser's cost per reply,
+  - failed calls and retries (see --error-rate / --malformed-rate).
+
+Nothing leaves the machine, so the numbers are a reproducible baseline for changes to
+the provider layer. Pass --json FILE to keep the results.
+
+Usage: python test/bench_providers.py [--calls 100] [--concurrency 8] [--latency 0.05]
+       [--tokens-per-second 0] [--providers "LM Studio" OpenAI] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from aiprompt_core.parsing import ShellResponseStreamParser  # noqa: E402
+from aiprompt_core.providers import LatencyPolicy, ProviderEngine  # noqa: E402
+from aiprompt_core.session import ChatSession  # noqa: E402
+from mock_lmstudio_server import MockServer, add_config_arguments, config_from_args  # noqa: E402
+
+MODEL = "mock-model"
+PROMPT = "list the five largest files in my home folder"
+
+
+async def call(engine, provider, server_url, stream):
+    session = ChatSession(engine, is_windows=False)
+    metrics = {}
+    on_token = (lambda token: None) if stream else None
+    start = time.perf_counter()
+    if provider == "LM Studio":
+        response = await session.send_lm_studio_prompt(MODEL, PROMPT, server_url, on_token=on_token, commit=False, metrics=metrics)
+    else:
+        response = await session.send_openai_prompt(MODEL, PROMPT, "sk-mock", on_token=on_token, commit=False, metrics=metrics)
+    latency = time.perf_counter() - start
+    ok = bool(response) and not response.get("error")
+    return latency, ok, metrics
+
+
+async def run_sequential(engine, provider, server_url, stream, calls):
+    return [await call(engine, provider, server_url, stream) for _ in range(calls)]
+
+
+async def run_concurrent(engine, provider, server_url, stream, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            return await call(engine, provider, server_url, stream)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(calls)))
+    return results, time.perf_counter() - start
+
+
+def stream_parse_cost(config, replies=50):
+    """Mean seconds to feed one mock reply through ShellResponseStreamParser, token by token."""
+    total = 0.0
+    for _ in range(replies):
+        tokens = config.reply_tokens()
+        start = time.perf_counter()
+        parser = ShellResponseStreamParser()
+        for token in tokens:
+            parser.feed(token)
+        total += time.perf_counter() - start
+    return total / replies
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def scenario(engine, config, provider, server_url, stream, args):
+    # One untimed call opens the connection and records the first latency sample
+    engine.run(call(engine, provider, server_url, stream))
+    sequential = engine.run(run_sequential(engine, provider, server_url, stream, args.calls))
+    concurrent, elapsed = engine.run(run_concurrent(engine, provider, server_url, stream, args.calls, args.concurrency))
+
+    latencies = [latency for latency, _, _ in sequential]
+    tokens = config.completion_tokens
+    simulated = config.latency + (tokens / config.tokens_per_second if config.tokens_per_second else 0)
+    results = sequential + concurrent
+    parse = [m["parse_s"] for _, _, m in results if m.get("parse_s") is not None]
+    ttft = [m["ttft_s"] for _, _, m in sequential if m.get("ttft_s") is not None]
+    return {
+        "provider": provider,
+        "stream": stream,
+        "calls": args.calls,
+        "mean_ms": ms(statistics.mean(latencies)),
+        "p50_ms": ms(LatencyPolicy.percentile(latencies, 50)),
+        "p95_ms": ms(LatencyPolicy.percentile(latencies, 95)),
+        "overhead_ms": ms(statistics.mean(latencies) - simulated),
+        "ttft_ms": ms(statistics.mean(ttft)) if ttft else None,
+        "concurrency": args.concurrency,
+        "throughput_per_s": round(args.calls / elapsed, 2),
+        "json_parse_us": round(statistics.mean(parse) * 1e6, 1) if parse else None,
+        "failed": sum(1 for _, ok, _ in results if not ok),
+        "retries": sum(max(0, (m.get("attempts") or 1) - 1) for _, _, m in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100, help="calls per scenario, sequential and concurrent")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--providers", nargs="+", choices=["LM Studio", "OpenAI"], default=["LM Studio", "OpenAI"])
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    config.models = [MODEL]
+    server = MockServer(config).start()
+    # The OpenAI SDK picks its base URL up from the environment when none is passed
+    os.environ["OPENAI_BASE_URL"] = server.base_url + "/v1"
+    engine = ProviderEngine()
+
+    rows = []
+    try:
+        for provider in args.providers:
+            for stream in (False, True):
+                rows.append(scenario(engine, config, provider, server.base_url, stream, args))
+    finally:
+        engine.shutdown()
+        server.stop()
+
+    stream_parse_s = stream_parse_cost(config)
+    print(f"Mock server: latency {config.latency * 1000:.0f} ms, "
+          f"{config.tokens_per_second or 'unthrottled'} tok/s, ~{config.completion_tokens} tokens per reply, "
+          f"error rate {config.error_rate:.0%}, malformed rate {config.malformed_rate:.0%}")
+    print(f"{'provider':<10} {'stream':<6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'overhead':>9} "
+          f"{'ttft ms':>8} {'calls/s':>8} {'parse us':>9} {'failed':>7} {'retries':>8}")
+    for row in rows:
+        ttft = f"{row['ttft_ms']:.2f}" if row["ttft_ms"] is not None else "-"
+        parse = f"{row['json_parse_us']:.1f}" if row["json_parse_us"] is not None else "-"
+        print(f"{row['provider']:<10} {'yes' if row['stream'] else 'no':<6} {row['mean_ms']:>8.2f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['overhead_ms']:>9.2f} {ttft:>8} {row['throughput_per_s']:>8.1f} "
+              f"{parse:>9} {row['failed']:>7} {row['retries']:>8}")
+    print(f"Stream parser: {stream_parse_s * 1e6:.1f} us per reply (ShellResponseStreamParser, token by token)")
+    print(f"Server counts: {config.counts}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "mock": {"latency": config.latency, "tokens_per_second": config.tokens_per_second,
+                         "completion_tokens": config.completion_tokens, "error_rate": config.error_rate,
+                         "malformed_rate": config.malformed_rate, "malformed_mode": config.malformed_mode},
+                "stream_parse_us": round(stream_parse_s * 1e6, 1),
+                "scenarios": rows,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Terminal Output throughput and Tk main-loop stalls while a command floods stdout.
+
+Starts the real LMStudioApp (with HOME pointed at a temp directory) and runs a generator
+command through execute_shell_command, i.e. the same CommandRunner -> root.after ->
+log_output path as the Run button. For each scenario (lines/sec x line length) it reports:
+
+  - lines/s        lines rendered into the Terminal Output box per second, end to end
+  - drain lag      how long the UI kept rendering after the command had exited
+  - stall max/p99  longest and 99th percentile main-loop stall, from a 10 ms heartbeat
+  - stalls >100ms  heartbeats that ran more than 100 ms late
+  - peak RSS       peak resident memory growth during the scenario (needs psutil)
+
+Needs a display; on a headless machine run it under Xvfb:
+
+  xvfb-run -a python test/bench_terminal_output.py
+
+Usage: python test/bench_terminal_output.py [--lines 20000] [--rates 0 2000 20000]
+       [--widths 80 400] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import statistics
+import sys
+import tempfile
+import time
+
+HEARTBEAT_MS = 10
+
+GENERATOR = '''
+import sys, time
+lines, rate, width = int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+padding = "x" * max(0, width - 9)
+start = time.perf_counter()
+for i in range(lines):
+    if rate:
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    sys.stdout.write(f"{i:08d} {padding}\\n")
+    if rate:
+        sys.stdout.flush()
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000, help="lines per scenario")
+    parser.add_argument("--rates", type=float, nargs="+", default=[0, 2000, 20000],
+                        help="lines per second the command writes (0 = as fast as possible)")
+    parser.add_argument("--widths", type=int, nargs="+", default=[80, 400], help="characters per line")
+    parser.add_argument("--timeout", type=float, default=300, help="give up on a scenario after this many seconds")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    args = parser.parse_args()
+
+    if platform.system() == "Linux" and not os.environ.get("DISPLAY"):
+        print("No display found; run under Xvfb: xvfb-run -a python test/bench_terminal_output.py", file=sys.stderr)
+        return 2
+
+    # Keep the app's chats, caches and logs out of the real profile
+    home = tempfile.mkdtemp(prefix="aiprompt-bench-")
+    os.environ["HOME"] = home
+    os.environ["APPDATA"] = home
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import tkinter as tk
+    import AIPrompt
+
+    try:
+        import psutil
+        process = psutil.Process()
+    except ImportError:
+        process = None
+
+    generator = os.path.join(home, "generate_output.py")
+    with open(generator, "w") as f:
+        f.write(GENERATOR)
+
+    root = tk.Tk()
+    app = AIPrompt.LMStudioApp(root)
+    # The app redirects stdout/stderr to its log files
+    sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+
+    scenarios = [(rate, width) for rate in args.rates for width in args.widths]
+    results = []
+    state = {}
+
+    def heartbeat():
+        now = time.perf_counter()
+        if "last_beat" in state:
+            state["gaps"].append(now - state["last_beat"] - HEARTBEAT_MS / 1000)
+        state["last_beat"] = now
+        if process is not None:
+            state["peak_rss"] = max(state["peak_rss"], process.memory_info().rss)
+        state["beat_job"] = root.after(HEARTBEAT_MS, heartbeat)
+
+    original_finish = app.finish_shell_command
+    original_start = app.command_runner.start
+
+    def finish_shell_command(output, error):
+        original_finish(output, error)
+        if state.pop("awaiting_exit", False):
+            # The timed-out command has been killed; move on
+            root.after(200, start_scenario)
+        else:
+            finish_scenario(error)
+
+    def start(command, on_line, on_exit):
+        def on_exit_timed(output, error):
+            state["exited"] = time.perf_counter()
+            on_exit(output, error)
+        original_start(command, on_line, on_exit_timed)
+
+    app.finish_shell_command = finish_shell_command
+    app.command_runner.start = start
+
+    def start_scenario():
+        if not scenarios:
+            root.after(0, root.quit)
+            return
+        rate, width = scenarios.pop(0)
+        app.clear_output()
+        root.update()
+        baseline = process.memory_info().rss if process is not None else 0
+        state.clear()
+        state.update(rate=rate, width=width, gaps=[], baseline=baseline, peak_rss=baseline)
+        command = " ".join(shlex.quote(part) for part in
+                           [sys.executable, generator, str(args.lines), str(rate), str(width)])
+        state["started"] = time.perf_counter()
+        state["timeout_job"] = root.after(int(args.timeout * 1000), lambda: finish_scenario("timed out"))
+        heartbeat()
+        app.execute_shell_command(command)
+
+    def finish_scenario(error):
+        if "started" not in state or "finished" in state:
+            return
+        state["finished"] = time.perf_counter()
+        root.after_cancel(state["beat_job"])
+        root.after_cancel(state["timeout_job"])
+        elapsed = state["finished"] - state["started"]
+        widget_lines = int(app.output_text.index("end-1c").split(".")[0]) - 1
+        gaps = sorted(state["gaps"]) or [0.0]
+        results.append({
+            "rate": state["rate"],
+            "width": state["width"],
+            "lines": args.lines,
+            "widget_lines": widget_lines,
+            "error": error,
+            "elapsed_s": round(elapsed, 3),
+            "lines_per_s": round(args.lines / elapsed, 1),
+            "drain_lag_s": round(state["finished"] - state.get("exited", state["finished"]), 3),
+            "stall_max_ms": round(gaps[-1] * 1000, 1),
+            "stall_p99_ms": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))] * 1000, 1),
+            "stall_mean_ms": round(statistics.mean(gaps) * 1000, 2),
+            "stalls_over_100ms": sum(1 for gap in gaps if gap > 0.1),
+            "peak_rss_growth_mb": round((state["peak_rss"] - state["baseline"]) / 1e6, 1) if process else None,
+        })
+        if error == "timed out":
+            state["awaiting_exit"] = True
+            app.kill_current_process()
+        else:
+            root.after(200, start_scenario)
+
+    root.after(500, start_scenario)
+    root.mainloop()
+
+    app.engine.shutdown()
+    root.destroy()
+
+    print(f"Terminal output benchmark: {args.lines} lines per scenario, {HEARTBEAT_MS} ms heartbeat")
+    print(f"{'rate/s':>8} {'width':>6} {'lines/s':>9} {'elapsed s':>10} {'drain lag s':>12} {'stall max ms':>13} "
+          f"{'p99 ms':>8} {'>100ms':>7} {'peak RSS MB':>12}")
+    for r in results:
+        rate = "flood" if not r["rate"] else f"{r['rate']:.0f}"
+        rss = f"{r['peak_rss_growth_mb']:.1f}" if r["peak_rss_growth_mb"] is not None else "-"
+        print(f"{rate:>8} {r['width']:>6} {r['lines_per_s']:>9.0f} {r['elapsed_s']:>10.2f} {r['drain_lag_s']:>12.2f} "
+              f"{r['stall_max_ms']:>13.1f} {r['stall_p99_ms']:>8.1f} {r['stalls_over_100ms']:>7} {rss:>12}"
+              + (f"  ({r['error']})" if r["error"] else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "tk": tk.TkVersion,
+                "scenarios": results,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Round-trip checks for the JSON chat store's per-chat journal (aiprompt_core.store).
+
+Each case saves a chat one or more times through ChatStore.save, then loads it with a
+fresh ChatStore (so nothing is served from the saving store's memory) and compares:
+  - appended exchanges and output lines,
+  - cleared output,
+  - output replaced by a rerun of the same command (same length, different content),
+  - a rewritten history,
+  - a torn last journal record left by a crash.
+
+Exits non-zero if any case fails, so it can run in CI.
+
+Usage: python test/check_chat_journal.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiprompt_core.store import ChatStore  # noqa: E402
+
+DONE = "Command execution completed."
+
+
+def exchange(prompt, command):
+    return {"prompt": prompt, "response": {"zsh": command, "powershell": "", "instructions": "", "title": prompt}}
+
+
+def case_append(store):
+    store.save("chat", "T", [exchange("list", "ls")], ["a"])
+    history = [exchange("list", "ls"), exchange("disk", "df -h")]
+    store.save("chat", "T", history, ["a", "b"])
+    return history, ["a", "b"]
+
+
+def case_cleared_output(store):
+    store.save("chat", "T", [], ["a", "b", DONE])
+    store.save("chat", "T", [], [])
+    return [], []
+
+
+def case_rerun_same_length(store):
+    # finish_shell_command replaces the output, and every run ends with the same line
+    store.save("chat", "T", [], ["Mon 10:00", DONE])
+    store.save("chat", "T", [], ["Mon 10:01", DONE])
+    return [], ["Mon 10:01", DONE]
+
+
+def case_rewritten_history(store):
+    store.save("chat", "T", [exchange("list", "ls")], [])
+    history = [exchange("list", "ls -la")]
+    store.save("chat", "T", history, [])
+    return history, []
+
+
+def case_torn_record(store):
+    store.save("chat", "T", [exchange("list", "ls")], [])
+    store.save("chat", "T", [exchange("list", "ls")], ["a"])
+    with open(store.journal_path("chat"), "ab") as f:
+        f.write(b'{"type":"output","posi')
+    return [exchange("list", "ls")], ["a"]
+
+
+CASES = [case_append, case_cleared_output, case_rerun_same_length, case_rewritten_history, case_torn_record]
+
+
+def main():
+    failures = []
+    for case in CASES:
+        directory = tempfile.mkdtemp(prefix="aiprompt-journal-")
+        try:
+            history, output = case(ChatStore(directory))
+            chat = ChatStore(directory).load("chat")
+            if chat["history"] != history or chat["terminal_output"] != output:
+                failures.append(f"{case.__name__}: loaded {chat['history']!r} / {chat['terminal_output']!r}, "
+                                f"expected {history!r} / {output!r}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print(f"OK ({len(CASES)} cases)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the UI-independent engine (aiprompt_core).
+
+Each run imports the engine modules in a fresh interpreter with HOME/APPDATA pointed
+at an empty temp directory, and checks that the import:
+  - takes less than the budget (best of --runs, default 150 ms),
+  - does not import tkinter, httpx or openai,
+  - creates no files or directories, configures no logging and leaves stdout/stderr alone.
+
+It also runs `AIPrompt.py --batch - --help` and checks that the headless entry point
+never imports tkinter, numpy or psutil.
+
+Exits non-zero if any check fails, so it can run in CI.
+
+Usage: python test/check_import_time.py [--budget-ms 150] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything a non-GUI entry point needs; the similarity index (optional numpy) is not part of it
+ENGINE_MODULES = [
+    "aiprompt_core",
+    "aiprompt_core.config",
+    "aiprompt_core.providers",
+    "aiprompt_core.session",
+    "aiprompt_core.store",
+    "aiprompt_core.commands",
+    "aiprompt_core.metrics",
+    "aiprompt_core.parsing",
+    "aiprompt_core.batch",
+]
+FORBIDDEN_MODULES = ["tkinter", "httpx", "openai"]
+# GUI-only imports that AIPrompt.py --batch must skip
+BATCH_FORBIDDEN_MODULES = ["tkinter", "numpy", "psutil"]
+
+PROBE = """
+import json, logging, os, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+home = os.environ["HOME"]
+print(json.dumps({{
+    "elapsed_ms": elapsed * 1000,
+    "forbidden": [m for m in {forbidden!r} if m in sys.modules],
+    "created": sorted(os.listdir(home)),
+    "stdout_redirected": sys.stdout is not sys.__stdout__ or sys.stderr is not sys.__stderr__,
+    "logging_configured": bool(logging.getLogger().handlers),
+}}), file=sys.__stdout__)
+"""
+
+BATCH_PROBE = """
+import runpy, sys
+sys.argv = ["AIPrompt.py", "--batch", "-", "--help"]
+try:
+    runpy.run_path("AIPrompt.py", run_name="__main__")
+except SystemExit:
+    pass
+print("MODULES:" + " ".join(m for m in {forbidden!r} if m in sys.modules), file=sys.__stderr__)
+"""
+
+
+def probe():
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, APPDATA=home, PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(modules=ENGINE_MODULES, forbidden=FORBIDDEN_MODULES)],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        return json.loads(result.stdout)
+
+
+def batch_probe():
+    """Returns the GUI-only modules that AIPrompt.py --batch imported."""
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, APPDATA=home, PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run(
+            [sys.executable, "-c", BATCH_PROBE.format(forbidden=BATCH_FORBIDDEN_MODULES)],
+            cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        line = [line for line in result.stderr.splitlines() if line.startswith("MODULES:")][-1]
+        return line[len("MODULES:"):].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters; the fastest run is checked")
+    args = parser.parse_args()
+
+    # Warm the bytecode cache once so the runs measure imports, not compilation
+    subprocess.run([sys.executable, "-c", "import " + ", ".join(ENGINE_MODULES)], cwd=REPO_ROOT, check=True)
+
+    runs = [probe() for _ in range(max(1, args.runs))]
+    best = min(run["elapsed_ms"] for run in runs)
+    print(f"Engine import time: best {best:.1f} ms, worst {max(run['elapsed_ms'] for run in runs):.1f} ms "
+          f"(budget {args.budget_ms:.0f} ms, {len(runs)} runs)")
+
+    failures = []
+    if best > args.budget_ms:
+        failures.append(f"import took {best:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    for run in runs:
+        if run["forbidden"]:
+            failures.append(f"import pulled in {', '.join(run['forbidden'])}")
+        if run["created"]:
+            failures.append(f"import created {', '.join(run['created'])} in the home directory")
+        if run["stdout_redirected"]:
+            failures.append("import redirected stdout/stderr")
+        if run["logging_configured"]:
+            failures.append("import configured the root logger")
+    batch_modules = batch_probe()
+    if batch_modules:
+        failures.append(f"AIPrompt.py --batch imported {', '.join(batch_modules)}")
+    for failure in sorted(set(failures)):
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
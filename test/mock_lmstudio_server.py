@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Stand-in for an LM Studio / OpenAI server, for measuring the request path offline.
+
+Implements GET /v1/models and POST /v1/chat/completions (streaming and non-streaming,
+including stream_options.include_usage) on plain HTTP. Every reply is a shell_response
+JSON object. Timing and failures are configurable:
+
+  --latency S           delay before the first byte of every completion
+  --tokens-per-second N pace of generated tokens (0 = as fast as possible)
+  --completion-tokens N approximate length of each reply in tokens
+  --error-rate F        fraction of completions answered with --error-status
+  --malformed-rate F    fraction of completions whose content is truncated JSON
+  --malformed-mode M    'content' (invalid assistant JSON) or 'body' (invalid HTTP body/stream chunk)
+
+Run standalone and point the app or batch mode at it (LM Studio URL, or OPENAI_BASE_URL
+for the OpenAI SDK), or start it in-process with MockServer(...).start().
+
+Usage: python test/mock_lmstudio_server.py [--port 1234] [--latency 0.2] [--tokens-per-second 50]
+"""
+
+import argparse
+import http.server
+import io
+import json
+import random
+import threading
+import time
+
+WORDS = ("list files process port network disk usage folder memory docker container git branch "
+         "log search replace archive permission user service restart").split()
+
+
+class MockConfig:
+    def __init__(self, models=("mock-model",), latency=0.0, tokens_per_second=0.0, completion_tokens=60,
+                 error_rate=0.0, error_status=503, malformed_rate=0.0, malformed_mode="content", seed=None):
+        self.models = list(models)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.malformed_mode = malformed_mode
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"models": 0, "completions": 0, "streamed": 0, "errors": 0, "malformed": 0}
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def reply_tokens(self):
+        """The reply as a list of completion_tokens tokens of 4 characters each."""
+        reply = {"powershell": "Get-ChildItem", "zsh": "ls -la", "instructions": "", "title": "Mock reply"}
+        room = self.completion_tokens * 4 - len(json.dumps(reply))
+        words = []
+        with self.lock:
+            while sum(len(w) + 1 for w in words) < room:
+                words.append(self.rng.choice(WORDS))
+        reply["instructions"] = " ".join(words)[:max(0, room)]
+        content = json.dumps(reply)
+        return [content[i:i + 4] for i in range(0, len(content), 4)]
+
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment so keep-alive calls don't hit delayed-ACK stalls
+    disable_nagle_algorithm = True
+    wbufsize = 65536
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def send_json(self, status, body):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/v1/models", "/models"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        self.config.count("models")
+        self.send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in self.config.models
+        ]})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Request body is not JSON"}})
+            return
+
+        config = self.config
+        config.count("completions")
+        if config.latency:
+            time.sleep(config.latency)
+        if config.roll(config.error_rate):
+            config.count("errors")
+            self.send_json(config.error_status, {"error": {"message": "Injected error", "type": "server_error"}})
+            return
+
+        tokens = config.reply_tokens()
+        malformed = config.roll(config.malformed_rate)
+        if malformed:
+            config.count("malformed")
+            if config.malformed_mode == "content":
+                # Cut the reply off mid-object
+                tokens = tokens[:len(tokens) // 2]
+        usage = {"prompt_tokens": sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4,
+                 "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = request.get("model", config.models[0])
+
+        if request.get("stream"):
+            config.count("streamed")
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self.stream_reply(model, tokens, usage if include_usage else None, malformed and config.malformed_mode == "body")
+            return
+
+        if config.tokens_per_second:
+            time.sleep(len(tokens) / config.tokens_per_second)
+        if malformed and config.malformed_mode == "body":
+            self.send_json(200, b'{"id": "chatcmpl-mock", "choices": [')
+            return
+        self.send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": usage,
+        })
+
+    def stream_reply(self, model, tokens, usage, garbage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        try:
+            send_event(chunk({"role": "assistant", "content": ""}))
+            for i, token in enumerate(tokens):
+                if interval:
+                    time.sleep(interval)
+                if garbage and i == len(tokens) // 2:
+                    send_event('{"choices": [{"delta": {"content": "')
+                send_event(chunk({"content": token}))
+            send_event(chunk({}, "stop"))
+            if usage is not None:
+                send_event(json.dumps({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0,
+                                       "model": model, "choices": [], "usage": usage}))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the request; stop streaming without a traceback. The
+            # buffered writer still holds the unsent bytes, so drop it for a sink that
+            # BaseHTTPRequestHandler can flush and close quietly.
+            self.close_connection = True
+            self.wfile = io.BytesIO()
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer:
+    """
+    Runs the mock server on a background thread. base_url is the LM Studio server URL;
+    base_url + "/v1" is the OpenAI base URL.
+    """
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.httpd = http.server.ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = self.config
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-lmstudio", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--models", nargs="+", default=["mock-model"])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte (default: 0)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="generation pace, 0 = unthrottled")
+    parser.add_argument("--completion-tokens", type=int, default=60, help="approximate reply length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of completions that are malformed")
+    parser.add_argument("--malformed-mode", choices=["content", "body"], default="content")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return MockConfig(models=args.models, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                      completion_tokens=args.completion_tokens, error_rate=args.error_rate,
+                      error_status=args.error_status, malformed_rate=args.malformed_rate,
+                      malformed_mode=args.malformed_mode, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(config_from_args(args), args.host, args.port)
+    print(f"Mock LM Studio server on {server.base_url} (OpenAI base URL {server.base_url}/v1), Ctrl+C to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Requests: {server.config.counts}")
+
+
+if __name__ == "__main__":
+    main()